@@ -0,0 +1,285 @@
+"""Vectorized daily contribution / weight-contribution analysis.
+
+Python counterpart of BacktestToolbox.calculate_daily_contribution and
+calculate_daily_weight_contribution: instead of re-joining weights, scores and returns once
+per date, all dates are computed at once from aligned dates x codes matrices.
+
+Matrix conventions (codes axis sorted ascending, as MATLAB joins sort by code):
+    W   normalized portfolio weights, 0 / NaN where the code is not held
+    S   portfolio scores, NaN where missing
+    R   daily pct_chg, NaN where the code has no return row that date
+    cw  index component weights (n_codes,), NaN for codes outside df_components
+"""
+from pathlib import Path
+from typing import List, Tuple
+import os
+import logging
+import argparse
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from weight_store import DEFAULT_STORE_NAME, WeightStore, open_store
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_CONFIG = os.path.abspath(os.path.join(os.path.dirname(__file__), 'config', 'db.yaml'))
+
+# DatabaseConnector.index_component_withdraw 中指数名称到 organization 的映射，未知指数按沪深300
+INDEX_ORGANIZATIONS = {'沪深300': 'hs300', 'hs300': 'hs300', '中证500': 'zz500', 'zz500': 'zz500',
+                       '中证1000': 'zz1000', 'zz1000': 'zz1000', '中证2000': 'zz2000', 'zz2000': 'zz2000',
+                       '中证A500': 'zzA500', 'zzA500': 'zzA500'}
+
+# 与 BacktestToolbox 导出的 _contribution.csv / _contribution_weight.csv 列一致
+CONTRIBUTION_COLUMNS = ['valuation_date', 'missing', 'top', 'component_1.0_0.8', 'component_0.8_0.6',
+                        'component_0.6_0.4', 'component_0.4_0.2', 'component_0.2_0.0']
+
+# calculate_daily_contribution.m: j = (i-1)*0.2, k = 0.2 + (i-1)*0.2, bucket = [q(1-k), q(1-j))
+_BUCKET_LOWER = [1 - (0.2 + i * 0.2) for i in range(5)]
+_BUCKET_UPPER = [1 - (i * 0.2) for i in range(5)]
+
+
+def _top_mask(S: np.ndarray, eligible: np.ndarray, top_number: int) -> np.ndarray:
+    """Per row, select the top_number highest scores among eligible entries.
+
+    Ties at the cut-off are resolved in column (code) order, matching the stable
+    sortrows(..., 'descend') used by the MATLAB implementation.
+    """
+    n_cols = S.shape[1]
+    k = min(int(top_number), n_cols)
+    if k <= 0 or n_cols == 0:
+        return np.zeros_like(eligible)
+    neg = np.where(eligible, -S, np.inf)
+    part = np.argpartition(neg, k - 1, axis=1)[:, k - 1:k]
+    thr = -np.take_along_axis(neg, part, axis=1)
+    gt = eligible & (S > thr)
+    eq = eligible & (S == thr)
+    need = np.minimum(k, eligible.sum(axis=1, keepdims=True)) - gt.sum(axis=1, keepdims=True)
+    return gt | (eq & (np.cumsum(eq, axis=1) <= need))
+
+
+def _bucket_sums(values: np.ndarray, score: np.ndarray, universe: np.ndarray, comp_w: np.ndarray,
+                 top_number: int) -> np.ndarray:
+    """Sum `values` into the 7 buckets [missing, top, component quintiles] for every row.
+
+    Only entries inside `universe` (the rows of the MATLAB merged table) take part.
+    """
+    out = np.zeros((values.shape[0], 7))
+    scored = universe & ~np.isnan(score)
+    out[:, 0] = np.where(universe & ~scored, values, 0.0).sum(axis=1)
+
+    top = _top_mask(score, scored & (comp_w == 0), top_number)
+    out[:, 1] = np.where(top, values, 0.0).sum(axis=1)
+
+    component = scored & (comp_w > 0)
+    Sc = np.where(component, score, np.nan)
+    with warnings.catch_warnings():
+        # rows without component scores yield NaN thresholds -> empty buckets
+        warnings.simplefilter('ignore', RuntimeWarning)
+        lower = np.nanquantile(Sc, _BUCKET_LOWER, axis=1, method='hazen')
+        upper = np.nanquantile(Sc, _BUCKET_UPPER, axis=1, method='hazen')
+    for i in range(5):
+        mask = component & (score < upper[i][:, None]) & (score >= lower[i][:, None])
+        out[:, i + 2] = np.where(mask, values, 0.0).sum(axis=1)
+    return out
+
+
+def _prepare(W: np.ndarray, S: np.ndarray, cw: np.ndarray):
+    held = np.nan_to_num(W, nan=0.0) > 0
+    is_comp = ~np.isnan(cw)
+    comp_w = np.broadcast_to(np.nan_to_num(cw, nan=0.0), W.shape)
+    weight = np.where(held, W, 0.0)
+    score = np.where(held, S, np.nan)
+    return held, is_comp, comp_w, weight, score
+
+
+def compute_contributions(W: np.ndarray, S: np.ndarray, R: np.ndarray, cw: np.ndarray,
+                          top_number: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-date excess-return contribution buckets (calculate_daily_contribution.m).
+
+    Returns (values, valid): values is (n_dates, 7); valid marks dates the MATLAB code
+    would have emitted (portfolio held, return data present, index return computable).
+    """
+    held, is_comp, comp_w, weight, score = _prepare(W, S, cw)
+    has_ret = ~np.isnan(R)
+    index_rows = is_comp[None, :] & has_ret
+    index_return = np.where(index_rows, comp_w * np.nan_to_num(R), 0.0).sum(axis=1)
+
+    universe = (held | is_comp[None, :]) & has_ret
+    valid = held.any(axis=1) & index_rows.any(axis=1) & universe.any(axis=1)
+
+    # MATLAB 将超额收益按代码顺序累乘（first_day_excess * cumprod(...)），此处逐列复现
+    factor = np.where(universe, 1.0 + (np.nan_to_num(R) - index_return[:, None]), 1.0)
+    excess = np.cumprod(factor, axis=1)
+
+    values = np.where(universe, excess * (weight - comp_w), 0.0)
+    return _bucket_sums(values, score, universe, comp_w, top_number), valid
+
+
+def compute_weight_contributions(W: np.ndarray, S: np.ndarray, cw: np.ndarray,
+                                 top_number: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-date active-weight buckets (calculate_daily_weight_contribution.m)."""
+    held, is_comp, comp_w, weight, score = _prepare(W, S, cw)
+    universe = held | is_comp[None, :]
+    valid = held.any(axis=1)
+
+    values = np.where(universe, weight - comp_w, 0.0)
+    return _bucket_sums(values, score, universe, comp_w, top_number), valid
+
+
+def to_contribution_frame(dates: np.ndarray, values: np.ndarray, valid: np.ndarray) -> pd.DataFrame:
+    df = pd.DataFrame(values[valid], columns=CONTRIBUTION_COLUMNS[1:])
+    df.insert(0, 'valuation_date', pd.to_datetime(np.asarray(dates)[valid]).strftime('%Y-%m-%d'))
+    return df
+
+
+def build_matrices(store: WeightStore, stock_returns: pd.DataFrame, components: pd.DataFrame,
+                   start=None, end=None):
+    """Align a weight store, long-format returns (valuation_date, code, pct_chg) and
+    index components (code, weight) into dates x codes matrices.
+
+    Weights are filtered (NaN / <= 0 dropped) and normalized per date exactly like
+    get_portfolio_weights.m. Returns (dates, codes, W, S, R, cw).
+    """
+    comp_codes = components['code'].astype(str).to_numpy()
+    dates, held_codes, _, _ = store.weight_matrix(start, end)
+    codes = np.union1d(held_codes, comp_codes)
+    dates, codes, W, S = store.weight_matrix(start, end, codes=codes)
+    col = pd.Index(codes)
+
+    cw = np.full(len(codes), np.nan)
+    cw[col.get_indexer(comp_codes)] = pd.to_numeric(components['weight'], errors='coerce').to_numpy()
+
+    R = np.full((len(dates), len(codes)), np.nan)
+    ret_dates = pd.to_datetime(stock_returns['valuation_date']).to_numpy().astype('datetime64[D]')
+    di = np.searchsorted(dates, ret_dates)
+    di_ok = (di < len(dates))
+    di_ok[di_ok] = dates[di[di_ok]] == ret_dates[di_ok]
+    ci = col.get_indexer(stock_returns['code'].astype(str))
+    ok = di_ok & (ci >= 0)
+    R[di[ok], ci[ok]] = pd.to_numeric(stock_returns['pct_chg'], errors='coerce').to_numpy()[ok]
+    return dates, codes, W, S, R, cw
+
+
+def run_contribution_analysis(store: WeightStore, stock_returns: pd.DataFrame, components: pd.DataFrame,
+                              top_number: int, start=None, end=None):
+    """Return (contribution_df, weight_contribution_df) in the exported CSV layouts."""
+    dates, _, W, S, R, cw = build_matrices(store, stock_returns, components, start, end)
+    contrib, valid = compute_contributions(W, S, R, cw, top_number)
+    weight_contrib, weight_valid = compute_weight_contributions(W, S, cw, top_number)
+    return to_contribution_frame(dates, contrib, valid), to_contribution_frame(dates, weight_contrib, weight_valid)
+
+
+def write_outputs(contrib_df: pd.DataFrame, weight_df: pd.DataFrame, output_dir: str, export_base: str):
+    os.makedirs(output_dir, exist_ok=True)
+    paths = [os.path.join(output_dir, f'{export_base}_contribution.csv'),
+             os.path.join(output_dir, f'{export_base}_contribution_weight.csv')]
+    for df, path in zip((contrib_df, weight_df), paths):
+        df.to_csv(path, index=False, encoding='utf-8', float_format='%.15g')
+        logger.info('已保存: %s', path)
+    return paths
+
+
+def export_inputs(start, end, index_type: str, returns_csv: str, components_csv: str,
+                  cfg_path: str = DEFAULT_DB_CONFIG):
+    """Write the returns and index components calculateContributionAnalysis loads from the database.
+
+    Uses the same queries as stock_return_withdraw.m (data_stock between start and end) and
+    DatabaseConnector.index_component_withdraw (components on start, or on the latest earlier
+    date), against the data database of db.yaml (user / host / database).
+    """
+    import yaml
+    from urllib.parse import quote_plus
+    from sqlalchemy import create_engine, text
+
+    with open(cfg_path, 'r', encoding='utf-8') as f:
+        cfg = yaml.safe_load(f) or {}
+    engine = create_engine(f"mysql+pymysql://{cfg['user']}:{quote_plus(str(cfg['password']))}"
+                           f"@{cfg['host']}:{cfg['port']}/{cfg['database']}")
+    organization = INDEX_ORGANIZATIONS.get(index_type, 'hs300')
+    try:
+        with engine.connect() as conn:
+            returns = pd.read_sql(text("SELECT valuation_date, code, pct_chg FROM data_stock "
+                                       "WHERE valuation_date BETWEEN :d0 AND :d1"), conn,
+                                  params={'d0': str(start), 'd1': str(end)})
+            comps = pd.read_sql(text("SELECT code, weight FROM data_indexcomponent WHERE organization = :org "
+                                     "AND valuation_date = (SELECT MAX(valuation_date) FROM data_indexcomponent "
+                                     "WHERE organization = :org AND valuation_date <= :d0)"), conn,
+                                params={'org': organization, 'd0': str(start)})
+    finally:
+        engine.dispose()
+    for df, path in ((returns, returns_csv), (comps, components_csv)):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        df.to_csv(path, index=False, encoding='utf-8', float_format='%.15g')
+    logger.info('已导出 %d 行收益率到 %s，%d 只 %s 成分股到 %s', len(returns), returns_csv, len(comps),
+                organization, components_csv)
+
+
+def check_parity(computed: pd.DataFrame, existing_csv: str, rtol: float = 1e-5, atol: float = 1e-9) -> List[str]:
+    """Compare a computed frame against an existing MATLAB export; returns a list of mismatches."""
+    ref = pd.read_csv(existing_csv, dtype={'valuation_date': str})
+    ref['valuation_date'] = pd.to_datetime(ref['valuation_date']).dt.strftime('%Y-%m-%d')
+    problems = []
+    if list(ref.columns) != CONTRIBUTION_COLUMNS:
+        problems.append(f'columns differ: {list(ref.columns)}')
+        return problems
+    merged = ref.merge(computed, on='valuation_date', how='outer', suffixes=('_ref', '_new'), indicator=True)
+    for side, label in (('left_only', 'only in reference'), ('right_only', 'only in computed')):
+        extra = merged.loc[merged['_merge'] == side, 'valuation_date'].tolist()
+        if extra:
+            problems.append(f'{len(extra)} dates {label}: {extra[:5]}')
+    both = merged[merged['_merge'] == 'both']
+    for col in CONTRIBUTION_COLUMNS[1:]:
+        a, b = both[f'{col}_ref'].to_numpy(float), both[f'{col}_new'].to_numpy(float)
+        bad = ~np.isclose(a, b, rtol=rtol, atol=atol, equal_nan=True)
+        if bad.any():
+            problems.append(f'{col}: {int(bad.sum())} dates differ, first {both["valuation_date"].iloc[int(np.argmax(bad))]}')
+    return problems
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)-8s %(name)s: %(message)s",
+                        datefmt="%Y-%m-%d %H:%M:%S")
+    parser = argparse.ArgumentParser(description='Vectorized contribution / weight-contribution analysis.')
+    parser.add_argument('input_path', help='Portfolio input folder (<yyyy-MM-dd> subfolders or a packed store)')
+    parser.add_argument('returns_csv', help='Stock returns CSV with valuation_date, code, pct_chg')
+    parser.add_argument('components_csv', help='Index components CSV with code, weight')
+    parser.add_argument('top_number', type=int, help='Number of top non-component stocks')
+    parser.add_argument('output_dir', help='Folder to write <export_base>_contribution(_weight).csv into')
+    parser.add_argument('export_base', help='Export base name (portfolio name without trailing _<digits>)')
+    parser.add_argument('--start', help='First valuation date (yyyy-MM-dd)')
+    parser.add_argument('--end', help='Last valuation date (yyyy-MM-dd)')
+    parser.add_argument('--store', help=f'Pack / append the input folder into this store file first '
+                                        f'(default: only read <input_path>/{DEFAULT_STORE_NAME})')
+    parser.add_argument('--export-inputs', metavar='INDEX_TYPE',
+                        help='First write returns_csv / components_csv from the database for this index '
+                             '(e.g. zz500), over --start .. --end or the dates of the store')
+    parser.add_argument('--check', action='store_true',
+                        help='Compare against existing CSVs in output_dir instead of overwriting them')
+    args = parser.parse_args()
+
+    store = open_store(args.input_path, args.store)
+    if args.export_inputs:
+        if not len(store) and not (args.start and args.end):
+            raise SystemExit('--export-inputs needs --start/--end when the store is empty')
+        export_inputs(args.start or str(store.dates[0]), args.end or str(store.dates[-1]),
+                      args.export_inputs, args.returns_csv, args.components_csv)
+    returns = pd.read_csv(args.returns_csv, dtype={'code': str, 'valuation_date': str})
+    comps = pd.read_csv(args.components_csv, dtype={'code': str})
+    contrib_df, weight_df = run_contribution_analysis(store, returns, comps, args.top_number, args.start, args.end)
+
+    if args.check:
+        failed = False
+        for df, suffix in ((contrib_df, '_contribution.csv'), (weight_df, '_contribution_weight.csv')):
+            ref = os.path.join(args.output_dir, args.export_base + suffix)
+            problems = check_parity(df, ref)
+            for p in problems:
+                logger.error('%s: %s', Path(ref).name, p)
+            if not problems:
+                logger.info('%s: 与现有结果一致 (%d 个日期)', Path(ref).name, len(df))
+            failed = failed or bool(problems)
+        raise SystemExit(1 if failed else 0)
+
+    write_outputs(contrib_df, weight_df, args.output_dir, args.export_base)
@@ -0,0 +1,204 @@
+"""Transaction-cost sensitivity sweep.
+
+calculate_portfolio_net_value_unified.m applies one cost_rate as
+portfolio_returns - turnover_rates * cost_rate. Given the daily pre-cost returns and
+turnover, every cost assumption is one row of a (n_costs x n_days) broadcast, so a whole
+grid of net-value curves and their metrics costs about the same as a single run.
+
+Returns are recovered from an exported <portfolio>_回测.csv (computed at --base-cost) and
+turnover from the portfolio's weight folders / packed weight store.
+"""
+from pathlib import Path
+from typing import Dict, Optional
+import os
+import logging
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from weight_store import DEFAULT_STORE_NAME, WeightStore, open_store
+
+logger = logging.getLogger(__name__)
+
+# BacktestToolbox.executeBacktest 中使用的成本费率
+DEFAULT_BASE_COST = 0.00085
+# 默认 0 ~ 19bp，共 20 个点
+DEFAULT_COST_GRID = np.round(np.arange(20) * 0.0001, 6)
+
+DEFAULT_DB_CONFIG = os.path.abspath(os.path.join(os.path.dirname(__file__), 'config', 'db.yaml'))
+
+METRIC_COLUMNS = ['cost_rate', 'final_net_value', 'annual_return_pct', 'sharpe_ratio', 'info_ratio',
+                  'max_drawdown_pct', 'annual_vol_pct']
+
+
+def _round2(x: np.ndarray) -> np.ndarray:
+    """MATLAB round(x, 2): halves are rounded away from zero."""
+    return np.sign(x) * np.floor(np.abs(x) * 100 + 0.5) / 100
+
+
+def nav_to_returns(nav: np.ndarray) -> np.ndarray:
+    """Daily returns from a net-value series; the first day is nav[0] - 1 (createResultTable)."""
+    nav = np.asarray(nav, dtype=np.float64)
+    return np.concatenate([nav[..., :1] - 1, np.diff(nav, axis=-1) / nav[..., :-1]], axis=-1)
+
+
+def turnover_from_store(store: WeightStore, start=None, end=None):
+    """Daily turnover sum(|w_t - w_{t-1}|) clipped to [0, 1], 0 on the first date (calculate_turnover_rate.m)."""
+    dates, _, W, _ = store.weight_matrix(start, end)
+    turnover = np.zeros(len(dates))
+    if len(dates) > 1:
+        turnover[1:] = np.clip(np.abs(np.diff(W, axis=0)).sum(axis=1), 0, 1)
+    return dates, turnover
+
+
+def sweep(gross_returns: np.ndarray, turnover: np.ndarray, benchmark_returns: np.ndarray,
+          cost_rates: np.ndarray) -> Dict[str, np.ndarray]:
+    """Net values and metrics for every cost rate in one 2D broadcast.
+
+    gross_returns / turnover / benchmark_returns are (n_days,), cost_rates is (n_costs,).
+    Metrics follow the whole-period definitions of BacktestToolbox.calculatePerformanceMetrics
+    (excess returns from the excess net value, 252 trading days per year).
+    """
+    cost_rates = np.asarray(cost_rates, dtype=np.float64)
+    net = gross_returns[None, :] - cost_rates[:, None] * turnover[None, :]
+    net = np.where(np.isfinite(net), net, 0.0)
+    nav = np.cumprod(1 + net, axis=1)
+
+    excess_nav = np.cumprod(1 + (net - benchmark_returns[None, :]), axis=1)
+    # calculatePerformanceMetrics 从第 2 天起由超额净值反推日超额收益
+    ex = np.diff(excess_nav, axis=1) / excess_nav[:, :-1]
+    n = ex.shape[1]
+
+    metrics = {'cost_rate': cost_rates, 'final_net_value': nav[:, -1]}
+    if n == 0:
+        zeros = np.zeros(len(cost_rates))
+        metrics.update(annual_return_pct=zeros, sharpe_ratio=zeros, info_ratio=zeros,
+                       max_drawdown_pct=zeros, annual_vol_pct=zeros)
+        return {'nav': nav, 'excess_nav': excess_nav, 'metrics': metrics}
+
+    ex_nav = np.cumprod(1 + ex, axis=1)
+    annual = (ex_nav[:, -1] - 1) * (252 / n)
+    vol = ex.std(axis=1, ddof=1) * np.sqrt(252) if n > 1 else np.zeros(len(cost_rates))
+    safe_vol = np.where(vol > 0, vol, 1.0)
+    sharpe = np.where(vol > 0, _round2(annual / safe_vol), 0.0)
+
+    port_daily = np.diff(nav, axis=1) / nav[:, :-1]
+    bench_nav = np.cumprod(1 + benchmark_returns)
+    bench_daily = np.diff(bench_nav) / bench_nav[:-1]
+    positive = (port_daily > 0) & (bench_daily[None, :] > 0)
+    n_pos = positive.sum(axis=1)
+    pos_total = np.prod(np.where(positive, 1 + ex, 1.0), axis=1) - 1
+    pos_annual = pos_total * 252 / np.maximum(n_pos, 1)
+    info = np.where((n_pos > 0) & (vol > 0), _round2(pos_annual / safe_vol), 0.0)
+
+    peak = np.maximum.accumulate(ex_nav, axis=1)
+    max_dd = ((peak - ex_nav) / peak).max(axis=1)
+
+    metrics.update(annual_return_pct=annual * 100, sharpe_ratio=sharpe, info_ratio=info,
+                   max_drawdown_pct=max_dd * 100, annual_vol_pct=vol * 100)
+    return {'nav': nav, 'excess_nav': excess_nav, 'metrics': metrics}
+
+
+def read_result_csv(csv_path: str) -> pd.DataFrame:
+    """Read an exported <portfolio>_回测.csv into valuation_date / benchmark / portfolio columns."""
+    df = pd.read_csv(csv_path)
+    df.columns = [c.strip() for c in df.columns]
+    df = df.rename(columns={'基准净值': 'benchmark_net_value', '组合净值': 'portfolio_net_value', '超额净值': 'excess_net_value'})
+    df['valuation_date'] = pd.to_datetime(df['valuation_date'], errors='coerce')
+    for col in ('benchmark_net_value', 'portfolio_net_value'):
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    # 与 calculatePerformanceMetrics 一致，只保留组合和基准都有效的行
+    return df.dropna(subset=['valuation_date', 'benchmark_net_value', 'portfolio_net_value']).reset_index(drop=True)
+
+
+def sweep_from_results(result_csv: str, store: WeightStore, cost_rates=DEFAULT_COST_GRID,
+                       base_cost: float = DEFAULT_BASE_COST):
+    """Recover gross returns from an exported result at base_cost and sweep cost_rates.
+
+    Returns (metrics DataFrame, net value DataFrame with one column per cost rate).
+    """
+    res = read_result_csv(result_csv)
+    t_dates, turnover = turnover_from_store(store, res['valuation_date'].min(), res['valuation_date'].max())
+    t = pd.Series(turnover, index=pd.to_datetime(t_dates))
+    aligned = t.reindex(res['valuation_date'])
+    if aligned.isna().any():
+        logger.warning('%d 个日期缺少权重数据，换手率按 0 处理', int(aligned.isna().sum()))
+    turnover = aligned.fillna(0.0).to_numpy()
+
+    net_returns = nav_to_returns(res['portfolio_net_value'].to_numpy())
+    gross = net_returns + base_cost * turnover
+    bench = nav_to_returns(res['benchmark_net_value'].to_numpy())
+    out = sweep(gross, turnover, bench, cost_rates)
+
+    metrics = pd.DataFrame(out['metrics'])[METRIC_COLUMNS]
+    curves = pd.DataFrame(out['nav'].T, columns=[f'{c:g}' for c in out['metrics']['cost_rate']])
+    curves.insert(0, 'valuation_date', res['valuation_date'].dt.strftime('%Y-%m-%d'))
+    return metrics, curves
+
+
+def import_sensitivity_to_mysql(metrics: pd.DataFrame, result_csv: str, table: str, cfg_path: str = DEFAULT_DB_CONFIG):
+    """Upsert the metrics table keyed by (session_id, id, portfolio_name, cost_rate)."""
+    import yaml
+    from importer import MySQLImporter
+
+    with open(cfg_path, 'r', encoding='utf-8') as f:
+        cfg = yaml.safe_load(f) or {}
+    database = cfg.get('database6') or cfg.get('database')
+
+    # output/backtest_results/<user>/<session_id>/<id>/<portfolio>_回测<start>_to_<end>/<file>
+    p = Path(result_csv)
+    df = metrics.copy()
+    df['portfolio_name'] = p.name[:-len('_回测.csv')] if p.name.endswith('_回测.csv') else p.stem
+    df['id'] = p.parent.parent.name
+    df['session_id'] = p.parent.parent.parent.name
+    df['update_time'] = pd.Timestamp.now()
+    schema = ([{'field': c, 'type': 'DECIMAL(18,8)'} for c in METRIC_COLUMNS] +
+              [{'field': 'portfolio_name', 'type': 'VARCHAR(150)'},
+               {'field': 'session_id', 'type': 'VARCHAR(50)'},
+               {'field': 'id', 'type': 'VARCHAR(50)'},
+               {'field': 'update_time', 'type': 'DATETIME'}])
+    pk_fields = ['session_id', 'id', 'portfolio_name', 'cost_rate']
+
+    importer = MySQLImporter(cfg_path)
+    try:
+        importer.create_table(table, schema, pk_fields, db=database)
+        importer.df_to_mysql(df, table, schema, pk_fields, database=database)
+    finally:
+        importer.close()
+
+
+def _parse_costs(text_value: Optional[str]):
+    if not text_value:
+        return DEFAULT_COST_GRID
+    return np.array([float(x) for x in text_value.split(',') if x.strip()])
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)-8s %(name)s: %(message)s",
+                        datefmt="%Y-%m-%d %H:%M:%S")
+    parser = argparse.ArgumentParser(description='Net values and metrics for a grid of transaction cost rates.')
+    parser.add_argument('result_csv', help='Exported <portfolio>_回测.csv')
+    parser.add_argument('input_path', help='Portfolio input folder (<yyyy-MM-dd> subfolders or a packed store)')
+    parser.add_argument('--store', help=f'Pack / append the input folder into this store file first '
+                                        f'(default: only read <input_path>/{DEFAULT_STORE_NAME})')
+    parser.add_argument('--costs', help='Comma separated cost rates (default: 0 ~ 0.0019, 20 points)')
+    parser.add_argument('--base-cost', type=float, default=DEFAULT_BASE_COST,
+                        help='Cost rate the result CSV was computed with')
+    parser.add_argument('--table', help='Also upsert the metrics into this MySQL table (database6)')
+    args = parser.parse_args()
+
+    metrics_df, curves_df = sweep_from_results(args.result_csv, open_store(args.input_path, args.store),
+                                               _parse_costs(args.costs), args.base_cost)
+
+    csv_path = Path(args.result_csv)
+    base = csv_path.name[:-len('_回测.csv')] if csv_path.name.endswith('_回测.csv') else csv_path.stem
+    metrics_path = csv_path.with_name(f'{base}_cost_sensitivity.csv')
+    curves_path = csv_path.with_name(f'{base}_cost_sensitivity_nav.csv')
+    metrics_df.to_csv(metrics_path, index=False, encoding='utf-8', float_format='%.15g')
+    curves_df.to_csv(curves_path, index=False, encoding='utf-8', float_format='%.15g')
+    logger.info('成本敏感性结果已保存: %s, %s', metrics_path, curves_path)
+
+    if args.table:
+        import_sensitivity_to_mysql(metrics_df, args.result_csv, args.table)
@@ -0,0 +1,215 @@
+"""Vectorized data-quality gate run on the combined frame before any database work.
+
+read_netvalue_csv and friends coerce unparsable values to NaN / NaT, which would otherwise
+reach MySQL as NULL keys or garbage rows. Every check here is a column-wise mask over the
+whole frame, so a bad file is rejected in milliseconds and without a database round trip.
+Rows carry the file they came from in SOURCE_COLUMN; a file with any failing row is
+quarantined as a whole (left out of the import and copied with the report into
+quarantine_dir).
+"""
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+import os
+import shutil
+import logging
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 每行记录来源文件的临时列，入库前删除
+SOURCE_COLUMN = '_source_file'
+
+DEFAULT_QUARANTINE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), 'logs', 'quarantine'))
+# 单日净值变动超过 50% 视为异常
+DEFAULT_MAX_DAILY_JUMP = 0.5
+DEFAULT_WEIGHT_TOLERANCE = 0.01
+# quarantine：隔离有问题的文件，其余照常导入 / reject：有任何问题则整批不导入 / off：不检查
+GATE_MODES = ('quarantine', 'reject', 'off')
+
+PORTFOLIO_FIELDS = ('user_name', 'session_id', 'id', 'portfolio_name')
+NET_VALUE_COLUMNS = ('benchmark_net_value', 'portfolio_net_value', 'excess_net_value')
+ISSUE_COLUMNS = ['check', 'source', 'rows', 'example']
+
+# 各结果表需要做的检查；主键检查对所有表都做
+TABLE_CHECKS = {
+    'netvalue': {'date_order': True, 'positive': NET_VALUE_COLUMNS, 'jump': NET_VALUE_COLUMNS},
+    'performance': {},
+    'contribution': {'date_order': True},
+    'contribution_weight': {'date_order': True, 'weights': True},
+}
+
+
+def _dates(s: pd.Series) -> pd.Series:
+    return pd.to_datetime(s, errors='coerce')
+
+
+def _group_codes(df: pd.DataFrame, group_fields: Sequence[str]) -> np.ndarray:
+    """Integer id of each row's portfolio (all zeros without group fields)."""
+    if not group_fields:
+        return np.zeros(len(df), dtype=np.int64)
+    return df.groupby(list(group_fields), sort=False, dropna=False).ngroup().to_numpy()
+
+
+def check_null_keys(df: pd.DataFrame, key_fields: Sequence[str]) -> pd.Series:
+    """Rows with a missing (None / NaN / NaT) key value."""
+    return df[list(key_fields)].isna().any(axis=1)
+
+
+def check_duplicate_keys(df: pd.DataFrame, key_fields: Sequence[str]) -> pd.Series:
+    """Every row of a key that appears more than once (the upsert would silently keep one)."""
+    return df.duplicated(subset=list(key_fields), keep=False)
+
+
+def check_date_order(df: pd.DataFrame, date_column: str, group_fields: Sequence[str],
+                     codes: Optional[np.ndarray] = None) -> pd.Series:
+    """Rows whose date is not after the previous row of the same portfolio, in file order."""
+    d = _dates(df[date_column]).to_numpy()
+    codes = _group_codes(df, group_fields) if codes is None else codes
+    # 稳定排序：同一组合内保持文件中的行序
+    idx = np.argsort(codes, kind='stable')
+    cur, prev = d[idx[1:]], d[idx[:-1]]
+    bad = np.zeros(len(df), dtype=bool)
+    bad[idx[1:]] = (codes[idx[1:]] == codes[idx[:-1]]) & ~np.isnat(cur) & ~np.isnat(prev) & (cur <= prev)
+    return pd.Series(bad, index=df.index)
+
+
+def check_positive(df: pd.DataFrame, columns: Sequence[str]) -> pd.Series:
+    values = df[list(columns)].apply(pd.to_numeric, errors='coerce')
+    return (values <= 0).any(axis=1)
+
+
+def check_daily_jump(df: pd.DataFrame, columns: Sequence[str], date_column: str, group_fields: Sequence[str],
+                     max_jump: float = DEFAULT_MAX_DAILY_JUMP, codes: Optional[np.ndarray] = None) -> pd.Series:
+    """Rows whose value moved by more than max_jump (relative) from the previous date of the portfolio."""
+    d = _dates(df[date_column]).to_numpy()
+    codes = _group_codes(df, group_fields) if codes is None else codes
+    # 日期缺失的行由 null_key 报告，不参与涨跌幅比较
+    rows = np.flatnonzero(~np.isnat(d))
+    idx = rows[np.lexsort((d[rows], codes[rows]))]
+    values = df[list(columns)].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)[idx]
+    cur, prev = values[1:], values[:-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = np.abs(cur / np.where(prev > 0, prev, np.nan) - 1)
+    jumped = (change > max_jump).any(axis=1) & (codes[idx[1:]] == codes[idx[:-1]])
+    bad = np.zeros(len(df), dtype=bool)
+    bad[idx[1:][jumped]] = True
+    return pd.Series(bad, index=df.index)
+
+
+def check_weight_sums(df: pd.DataFrame, date_column: str, group_fields: Sequence[str],
+                      tolerance: float = DEFAULT_WEIGHT_TOLERANCE) -> pd.Series:
+    """Rows of a portfolio-date whose active-weight buckets add up to more than 1 in magnitude.
+
+    The bucket files written by calculate_daily_weight_contribution.m hold active weights
+    (portfolio weight - index weight). Their exact per-date sum depends on how much of the
+    portfolio and index falls into the buckets, so the only hard bound is [-1, 1]. The check
+    is deliberately weak: it catches gross garbage such as percent-scaled or doubled files,
+    not subtly wrong weights.
+    """
+    keys = [df[g] for g in group_fields] + [_dates(df[date_column])]
+    skip = set(group_fields) | {date_column, SOURCE_COLUMN, 'update_time'}
+    numeric = df[[c for c in df.columns if c not in skip]].apply(pd.to_numeric, errors='coerce')
+    numeric = numeric.loc[:, numeric.notna().any()]
+    if numeric.empty:
+        return pd.Series(False, index=df.index)
+    total = numeric.sum(axis=1).groupby(keys, dropna=False).transform('sum')
+    return total.abs() > 1 + tolerance
+
+
+def _summarize(check: str, df: pd.DataFrame, mask: pd.Series, key_fields: Sequence[str]) -> List[Dict]:
+    if not mask.any():
+        return []
+    bad = df.loc[mask]
+    sources = bad[SOURCE_COLUMN] if SOURCE_COLUMN in bad.columns else pd.Series('', index=bad.index)
+    shown = [c for c in key_fields if c in bad.columns]
+    rows = []
+    for source, idx in sources.groupby(sources, sort=False).groups.items():
+        first = bad.loc[idx[0], shown] if shown else None
+        example = ', '.join(f'{k}={first[k]}' for k in shown) if first is not None else ''
+        rows.append({'check': check, 'source': source, 'rows': len(idx), 'example': example})
+    return rows
+
+
+def validate_frame(df: pd.DataFrame, kind: str, key_fields: Sequence[str], date_column: str = 'valuation_date',
+                   max_daily_jump: float = DEFAULT_MAX_DAILY_JUMP,
+                   weight_tolerance: float = DEFAULT_WEIGHT_TOLERANCE) -> pd.DataFrame:
+    """Run the checks of TABLE_CHECKS[kind] and return one issue row per (check, source file)."""
+    spec = TABLE_CHECKS[kind]
+    key_fields = [k for k in key_fields if k in df.columns]
+    group_fields = [g for g in PORTFOLIO_FIELDS if g in df.columns]
+    has_date = date_column in df.columns
+    shown = key_fields or group_fields + ([date_column] if has_date else [])
+    # 组合编号只算一次，供日期顺序和涨跌幅检查共用
+    codes = _group_codes(df, group_fields)
+
+    issues = []
+    if key_fields:
+        null_keys = check_null_keys(df, key_fields)
+        issues += _summarize('null_key', df, null_keys, shown)
+        issues += _summarize('duplicate_key', df, check_duplicate_keys(df, key_fields) & ~null_keys, shown)
+    if has_date and spec.get('date_order'):
+        issues += _summarize('date_order', df, check_date_order(df, date_column, group_fields, codes), shown)
+    positive = [c for c in spec.get('positive', ()) if c in df.columns]
+    if positive:
+        issues += _summarize('non_positive', df, check_positive(df, positive), shown)
+    jump = [c for c in spec.get('jump', ()) if c in df.columns]
+    if jump and has_date:
+        mask = check_daily_jump(df, jump, date_column, group_fields, max_daily_jump, codes)
+        issues += _summarize('daily_jump', df, mask, shown)
+    if has_date and spec.get('weights'):
+        mask = check_weight_sums(df, date_column, group_fields, weight_tolerance)
+        issues += _summarize('weight_sum', df, mask, shown)
+    return pd.DataFrame(issues, columns=ISSUE_COLUMNS)
+
+
+def quarantine_files(sources: Sequence[str], issues: pd.DataFrame, quarantine_dir: str, table: str) -> str:
+    """Copy the rejected files (keeping their relative layout) and report.csv into a timestamped folder."""
+    files = [s for s in sources if s and os.path.isfile(s)]
+    target = Path(quarantine_dir) / table / dt.datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    target.mkdir(parents=True, exist_ok=True)
+    root = os.path.commonpath(files) if len(files) > 1 else os.path.dirname(files[0]) if files else ''
+    for src in files:
+        dest = target / os.path.relpath(src, root)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(src, dest)
+    issues.to_csv(target / 'report.csv', index=False, encoding='utf-8')
+    return str(target)
+
+
+def quality_gate(df: pd.DataFrame, kind: str, key_fields: Sequence[str], table: str,
+                 cfg: Optional[Dict] = None) -> pd.DataFrame:
+    """Validate the combined frame, log a compact report and drop the rows of rejected files.
+
+    Returns the clean frame without SOURCE_COLUMN. In `reject` mode any issue raises
+    ValueError so nothing is imported.
+    """
+    cfg = cfg or {}
+    mode = cfg.get('quality_gate', 'quarantine')
+    if mode not in GATE_MODES:
+        raise ValueError(f"quality_gate 只支持 {' / '.join(GATE_MODES)}: {mode}")
+    if mode == 'off' or df.empty:
+        return df.drop(columns=[SOURCE_COLUMN], errors='ignore')
+
+    issues = validate_frame(df, kind, key_fields,
+                            max_daily_jump=float(cfg.get('quality_max_daily_jump', DEFAULT_MAX_DAILY_JUMP)),
+                            weight_tolerance=float(cfg.get('quality_weight_tolerance', DEFAULT_WEIGHT_TOLERANCE)))
+    if issues.empty:
+        return df.drop(columns=[SOURCE_COLUMN], errors='ignore')
+
+    bad_sources = list(dict.fromkeys(issues['source']))
+    logger.warning('数据质量检查未通过 (%s): %d 个文件, %d 类问题', table, len(bad_sources), issues['check'].nunique())
+    for row in issues.itertuples(index=False):
+        logger.warning('  %-13s %5d 行  %s  例: %s', row.check, row.rows, row.source, row.example)
+
+    if mode == 'reject':
+        raise ValueError(f'数据质量检查未通过，{table} 本批数据不导入')
+
+    folder = quarantine_files(bad_sources, issues, cfg.get('quarantine_dir', DEFAULT_QUARANTINE_DIR), table)
+    logger.warning('已隔离 %d 个文件到 %s', len(bad_sources), folder)
+    if SOURCE_COLUMN not in df.columns:
+        return df.iloc[0:0]
+    clean = df.loc[~df[SOURCE_COLUMN].isin(bad_sources)]
+    return clean.drop(columns=[SOURCE_COLUMN])
@@ -0,0 +1,126 @@
+"""Lightweight client for import_service.py.
+
+Only uses the standard library so a call costs an interpreter start plus one localhost
+round trip. The positional arguments are the same as the import scripts, prefixed by the
+job name:
+
+    python import_client.py netvalue      <table> [sid] [base_folder]
+    python import_client.py performance   <table> [sid] [base_folder]
+    python import_client.py contributions <contrib_table> [weight_table] [sid] [base_folder]
+
+When the service is not running (the connection is refused) the job is executed
+in-process, with the same result as calling the import script directly, so callers never
+depend on the service being up. Once a job has been sent it is never re-run locally: if
+the service drops the connection or the reply times out, the job may still be running
+there, so the client reports failure instead.
+"""
+import os
+import sys
+import json
+import socket
+import argparse
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = int(os.environ.get('BACKTEST_IMPORT_PORT', 8765))
+# 导入大文件夹可能需要几分钟
+DEFAULT_TIMEOUT = 3600.0
+
+JOB_ARGS = {
+    'netvalue': ('table', 'sid', 'base_folder'),
+    'performance': ('table', 'sid', 'base_folder'),
+    'contributions': ('table', 'weight_table', 'sid', 'base_folder'),
+}
+
+
+def send_message(sock: socket.socket, message: dict):
+    sock.sendall(json.dumps(message, ensure_ascii=False).encode('utf-8') + b'\n')
+
+
+def recv_message(rfile) -> dict:
+    line = rfile.readline()
+    if not line:
+        raise ConnectionError('connection closed before a reply was received')
+    return json.loads(line.decode('utf-8'))
+
+
+def build_job(job: str, args) -> dict:
+    """Map the positional script arguments of a job onto a JSON job."""
+    names = JOB_ARGS[job]
+    if not args or len(args) > len(names):
+        raise ValueError(f"{job} expects {' '.join(names)}")
+    # 参数原样传递（包括 MATLAB 传入的空字符串 sid），与直接调用导入脚本时 argparse 的结果一致
+    message = {'job': job}
+    message.update(zip(names, args))
+    return message
+
+
+def connect(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, timeout: float = DEFAULT_TIMEOUT) -> socket.socket:
+    """Open a connection to the service; raises OSError if it is not running."""
+    return socket.create_connection((host, port), timeout=timeout)
+
+
+def exchange(sock: socket.socket, message: dict) -> dict:
+    """Send one job on an open connection and wait for its reply."""
+    with sock:
+        send_message(sock, message)
+        with sock.makefile('rb') as rfile:
+            return recv_message(rfile)
+
+
+def request(message: dict, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+            timeout: float = DEFAULT_TIMEOUT) -> dict:
+    """Send one job to the service and return its reply; raises OSError if it is not reachable."""
+    return exchange(connect(host, port, timeout), message)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Submit an import job to the local import service.')
+    parser.add_argument('job', choices=sorted(JOB_ARGS) + ['ping', 'shutdown'])
+    parser.add_argument('args', nargs='*', help='Same positional arguments as the import script.')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT)
+    parser.add_argument('--no-fallback', action='store_true',
+                        help='Fail instead of running the job in-process when the service is down.')
+    args = parser.parse_args(argv)
+
+    if args.job in JOB_ARGS:
+        try:
+            message = build_job(args.job, args.args)
+        except ValueError as e:
+            parser.error(str(e))
+    else:
+        message = {'job': args.job}
+
+    try:
+        sock = connect(args.host, args.port, args.timeout)
+    except OSError as e:
+        if args.no_fallback or args.job not in JOB_ARGS:
+            print(f'import service not reachable at {args.host}:{args.port}: {e}', file=sys.stderr)
+            return 1
+        sock = None
+
+    if sock is not None:
+        try:
+            reply = exchange(sock, message)
+        except (OSError, ValueError) as e:
+            # 任务已发出，服务可能仍在执行，不能在本进程内再跑一遍
+            print(f'import service at {args.host}:{args.port} did not return a reply: {e}', file=sys.stderr)
+            return 1
+    else:
+        # 服务未启动：在本进程内执行，代价与直接调用导入脚本相同
+        import logging
+        from import_service import run_job
+
+        logging.basicConfig(level=logging.INFO,
+                            format="%(asctime)s %(levelname)-8s %(name)s: %(message)s",
+                            datefmt="%Y-%m-%d %H:%M:%S")
+        reply = run_job(message, capture=False)
+
+    if reply.get('output'):
+        print(reply['output'])
+    return 0 if reply.get('ok') else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
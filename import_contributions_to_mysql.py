@@ -1,15 +1,13 @@
 from pathlib import Path
-import pandas as pd
+from typing import TYPE_CHECKING
 import os
-import yaml
 import logging
 import argparse
 
-from importer import MySQLImporter
-
-logging.basicConfig(level=logging.INFO,
-                    format="%(asctime)s %(levelname)-8s %(name)s: %(message)s",
-                    datefmt="%Y-%m-%d %H:%M:%S")
+# pandas / yaml / importer (SQLAlchemy) 只在找到待导入文件后才加载
+if TYPE_CHECKING:
+    import pandas as pd
+    from importer import MySQLImporter
 
 DEFAULT_DB_CONFIG = os.path.abspath(os.path.join(os.path.dirname(__file__), 'config', 'db.yaml'))
 
@@ -28,6 +26,8 @@ def discover_files(base_folder: str, patterns):
 
 def try_read_csv(fp: str):
     # pandas can often infer compression; try robustly
+    import pandas as pd
+
     try:
         return pd.read_csv(fp, compression='infer')
     except Exception:
@@ -38,7 +38,9 @@ def try_read_csv(fp: str):
             return None
 
 
-def infer_schema_from_df(df: pd.DataFrame):
+def infer_schema_from_df(df: 'pd.DataFrame'):
+    import pandas as pd
+
     schema = []
     for col in df.columns:
         ser = df[col]
@@ -61,18 +63,25 @@ def infer_schema_from_df(df: pd.DataFrame):
     return schema
 
 
-def import_files_to_table(files, table_name, cfg_path, database, sub1=None):
+def import_files_to_table(files, table_name, cfg_path, database, sub1=None, importer: 'MySQLImporter' = None,
+                          kind: str = 'contribution'):
     if not files:
         logging.info('No files to import for table %s', table_name)
         return
 
-    importer = MySQLImporter(cfg_path)
-    # load pk from config if present
+    import yaml
+    import pandas as pd
+    from importer import CONTRIBUTION_KEY_FIELDS, open_importer
+    from data_quality import SOURCE_COLUMN, quality_gate
+
+    # load pk (and the default database) from config if present
     try:
         with open(cfg_path, 'r', encoding='utf-8') as f:
             cfg = yaml.safe_load(f) or {}
     except Exception:
+        logging.exception('Failed to read db config: %s', cfg_path)
         cfg = {}
+    database = database or cfg.get('database6') or cfg.get('database')
 
     pk = cfg.get('pk', '')
     pk_fields = [p.strip() for p in pk.split(',') if p.strip()]
@@ -97,6 +106,7 @@ def import_files_to_table(files, table_name, cfg_path, database, sub1=None):
             df['id'] = id_val
         if 'portfolio_name' not in df.columns:
             df['portfolio_name'] = p.stem.replace('_contribution_weight', '').replace('_contribution', '')
+        df[SOURCE_COLUMN] = fp
 
         dfs.append(df)
 
@@ -121,41 +131,41 @@ def import_files_to_table(files, table_name, cfg_path, database, sub1=None):
 
           
 
-    schema = infer_schema_from_df(combined)
-    try:
-        importer.create_table(table_name, schema, pk_fields, db=database)
-    except Exception:
-        logging.exception('create_table failed for %s', table_name)
+    if not pk_fields:
+        pk_fields = [k for k in CONTRIBUTION_KEY_FIELDS if k in combined.columns]
 
-    importer.df_to_mysql(combined, table_name, schema, pk_fields, database=database)
-    logging.info('导入 %d 行到 %s.%s', len(combined), database, table_name)
-    importer.close()
+    combined = quality_gate(combined, kind, pk_fields, table_name, cfg)
+    if combined.empty:
+        logging.info('No rows passed the data quality checks for table %s', table_name)
+        return
+
+    schema = infer_schema_from_df(combined)
+    with open_importer(cfg_path, importer) as importer:
+        importer.import_frame(combined, table_name, schema, pk_fields, database=database,
+                              source=os.path.commonpath(files))
 
 
-def main(contrib_table: str, weight_table: str = None, sub1: str = None, base_folder: str = None, cfg_path: str = DEFAULT_DB_CONFIG):
+def main(contrib_table: str, weight_table: str = None, sub1: str = None, base_folder: str = None, cfg_path: str = DEFAULT_DB_CONFIG,
+         importer: 'MySQLImporter' = None):
     base_folder = base_folder or os.getcwd()
 
     # discover files
     contrib_patterns = ('*_contribution.csv', '*_contribution.csvz', '*_contribution.*')
     weight_patterns = ('*_contribution_weight.csv', '*_contribution_weight.csvz', '*_contribution_weight.*')
 
-    try:
-        with open(cfg_path, 'r', encoding='utf-8') as f:
-            cfg = yaml.safe_load(f) or {}
-            db = cfg.get('database6') or cfg.get('database')
-    except Exception:
-        logging.exception('Failed to read db config: %s', cfg_path)
-        db = None
+    # database6 / database is resolved by import_files_to_table once files are found
+    db = None
 
     contrib_files = discover_files(base_folder, contrib_patterns)
     
     if contrib_table:
-        import_files_to_table(contrib_files, contrib_table, cfg_path, db, sub1=sub1)
+        import_files_to_table(contrib_files, contrib_table, cfg_path, db, sub1=sub1, importer=importer)
 
     if weight_table:
         weight_files = discover_files(base_folder, weight_patterns)
    
-        import_files_to_table(weight_files, weight_table, cfg_path, db, sub1=sub1)
+        import_files_to_table(weight_files, weight_table, cfg_path, db, sub1=sub1, importer=importer,
+                              kind='contribution_weight')
 
 
 if __name__ == '__main__':
@@ -166,4 +176,8 @@ if __name__ == '__main__':
     parser.add_argument('base_folder', nargs='?', help='base folder to search (optional)')
     args = parser.parse_args()
 
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)-8s %(name)s: %(message)s",
+                        datefmt="%Y-%m-%d %H:%M:%S")
+
     main(args.contrib_table, args.weight_table, args.sub1, args.base_folder)
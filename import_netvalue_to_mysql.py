@@ -1,28 +1,15 @@
 from pathlib import Path
-import pandas as pd
+from typing import TYPE_CHECKING
 import os
-import yaml
+import sys
 import logging
 import argparse
-import sys
-
-from importer import MySQLImporter
 
-logging.basicConfig(level=logging.INFO,
-                    format="%(asctime)s %(levelname)-8s %(name)s: %(message)s",
-                    datefmt="%Y-%m-%d %H:%M:%S")
+# pandas / yaml / importer (SQLAlchemy) 只在找到待导入文件后才加载，空目录或 --help 时秒回
+if TYPE_CHECKING:
+    from importer import MySQLImporter
 
 DEFAULT_DB_CONFIG = os.path.abspath(os.path.join(os.path.dirname(__file__), 'config', 'db.yaml'))
-PATHS_CONFIG = os.path.abspath(os.path.join(os.path.dirname(__file__), 'config', 'paths.yaml'))
-
-# try to read default temp dir from paths.yaml
-try:
-    with open(PATHS_CONFIG, 'r', encoding='utf-8') as f:
-        path_cfg = yaml.safe_load(f) or {}
-        A_FOLDER = path_cfg.get('tempp_dir')
-except Exception:
-    A_FOLDER = None
-
 
 SCHEMA = [
     {'field': 'valuation_date', 'type': 'DATE'},
@@ -44,6 +31,8 @@ def discover_csv_files(a_folder: str):
 
 
 def read_netvalue_csv(csv_path: str, session_id: str = None, id_val: str = None):
+    import pandas as pd
+
     df = pd.read_csv(csv_path, dtype=str)
     df.columns = [c.strip() for c in df.columns]
 
@@ -115,21 +104,16 @@ def read_netvalue_csv(csv_path: str, session_id: str = None, id_val: str = None)
     return df2
 
 
-def import_netvalues_to_mysql(database: str, table: str, cfg_path: str = DEFAULT_DB_CONFIG, sub1: str = None, base_folder_arg: str = None):
+def import_netvalues_to_mysql(database: str, table: str, cfg_path: str = DEFAULT_DB_CONFIG, sub1: str = None, base_folder_arg: str = None,
+                              importer: 'MySQLImporter' = None):
+    """database=None means database6 from the config, resolved only once files are found."""
     cfg_path = os.path.abspath(cfg_path)
     if not os.path.exists(cfg_path):
         logging.error('config file not found: %s', cfg_path)
         raise FileNotFoundError(cfg_path)
 
-    with open(cfg_path, 'r', encoding='utf-8') as f:
-        cfg = yaml.safe_load(f) or {}
-
     if not table:
         raise ValueError('table name must be provided')
-    if not database:
-        raise ValueError('database name must be provided')
-
-   
 
     base_folder = base_folder_arg
    
@@ -149,6 +133,20 @@ def import_netvalues_to_mysql(database: str, table: str, cfg_path: str = DEFAULT
     if not csvs:
         logging.info('在 %s 中未找到 csv 文件。', a_folder)
         return
+    if not any('回测' in Path(csv).name for csv in csvs):
+        logging.info('在 %s 中未找到回测 csv 文件。', a_folder)
+        return
+
+    import yaml
+    import pandas as pd
+    from importer import open_importer
+    from data_quality import SOURCE_COLUMN, quality_gate
+
+    with open(cfg_path, 'r', encoding='utf-8') as f:
+        cfg = yaml.safe_load(f) or {}
+    database = database or cfg.get('database6')
+    if not database:
+        raise ValueError('database name must be provided')
 
     all_rows = []
     processed_files = []
@@ -173,6 +171,7 @@ def import_netvalues_to_mysql(database: str, table: str, cfg_path: str = DEFAULT
 
             use_session = sub1
             df = read_netvalue_csv(csv, session_id=use_session, id_val=use_id)
+            df[SOURCE_COLUMN] = csv
             all_rows.append(df)
             processed_files.append(csv)
         except Exception:
@@ -187,22 +186,18 @@ def import_netvalues_to_mysql(database: str, table: str, cfg_path: str = DEFAULT
         return
 
     combined = pd.concat(all_rows, ignore_index=True)
-
-    logging.info('准备上传 %d 行到表 %s (database: %s)', len(combined), table, database)
-
-
-
-    importer = MySQLImporter(cfg_path)
     pk = cfg.get('pk', 'valuation_date,session_id,id,')
     pk_fields = [p.strip() for p in pk.split(',') if p.strip()]
 
-    try:
-        importer.create_table(table, SCHEMA, pk_fields, db=database)
-    except Exception:
-        logging.exception('尝试创建表 %s.%s 时出错', database, table)
+    combined = quality_gate(combined, 'netvalue', pk_fields, table, cfg)
+    if combined.empty:
+        logging.info('没有通过数据质量检查的数据。')
+        return
+
+    logging.info('准备上传 %d 行到表 %s (database: %s)', len(combined), table, database)
 
-    importer.df_to_mysql(combined, table, SCHEMA, pk_fields, database=database)
-    importer.close()
+    with open_importer(cfg_path, importer) as importer:
+        importer.import_frame(combined, table, SCHEMA, pk_fields, database=database, source=a_folder)
 
 
 def main(database: str, table: str, sub1: str = None, base_folder_arg: str = None):
@@ -210,6 +205,8 @@ def main(database: str, table: str, sub1: str = None, base_folder_arg: str = Non
         import_netvalues_to_mysql(database=database, table=table, sub1=sub1, base_folder_arg=base_folder_arg)
     except Exception as e:
         logging.error('导入失败: %s', e)
+        return 1
+    return 0
 
 
 if __name__ == "__main__":
@@ -221,15 +218,9 @@ if __name__ == "__main__":
    
     args = parser.parse_args()
 
-    # load default config
-    cfg = {}
-    try:
-        if os.path.exists(DEFAULT_DB_CONFIG):
-            with open(DEFAULT_DB_CONFIG, 'r', encoding='utf-8') as f:
-                cfg = yaml.safe_load(f) or {}
-    except Exception:
-        logging.exception('读取默认配置文件失败: %s', DEFAULT_DB_CONFIG)
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)-8s %(name)s: %(message)s",
+                        datefmt="%Y-%m-%d %H:%M:%S")
 
-    db_name = cfg['database6'] 
-   
-    main(db_name, args.table, args.sub1, args.base_folder)
+    # database6 从默认配置读取，找到待导入文件后才解析配置
+    sys.exit(main(None, args.table, args.sub1, args.base_folder))
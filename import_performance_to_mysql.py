@@ -1,15 +1,13 @@
 from pathlib import Path
-import pandas as pd
+from typing import TYPE_CHECKING
 import os
-import yaml
+import sys
 import logging
 import argparse
 
-from importer import MySQLImporter
-
-logging.basicConfig(level=logging.INFO,
-                    format="%(asctime)s %(levelname)-8s %(name)s: %(message)s",
-                    datefmt="%Y-%m-%d %H:%M:%S")
+# pandas / yaml / importer (SQLAlchemy) 只在找到待导入文件后才加载
+if TYPE_CHECKING:
+    from importer import MySQLImporter
 
 DEFAULT_DB_CONFIG = os.path.abspath(os.path.join(os.path.dirname(__file__), 'config', 'db.yaml'))
 
@@ -36,6 +34,8 @@ def discover_summary_csvs(base_folder: str):
 
 def read_summary_csv(csv_path: str, session_id: str = None, id_val: str = None):
     # Read the single-line performance summary CSV and return a DataFrame with exact columns
+    import pandas as pd
+
     df = pd.read_csv(csv_path, dtype=str)
     df.columns = [c.strip() for c in df.columns]
 
@@ -106,19 +106,16 @@ def read_summary_csv(csv_path: str, session_id: str = None, id_val: str = None):
     return df2
 
 
-def import_performance_to_mysql(database: str, table: str, cfg_path: str = DEFAULT_DB_CONFIG, sub1: str = None, base_folder_arg: str = None):
+def import_performance_to_mysql(database: str, table: str, cfg_path: str = DEFAULT_DB_CONFIG, sub1: str = None, base_folder_arg: str = None,
+                                importer: 'MySQLImporter' = None):
+    """database=None means database6 (or database) from the config, resolved only once files are found."""
     cfg_path = os.path.abspath(cfg_path)
     if not os.path.exists(cfg_path):
         logging.error('config file not found: %s', cfg_path)
         raise FileNotFoundError(cfg_path)
 
-    with open(cfg_path, 'r', encoding='utf-8') as f:
-        cfg = yaml.safe_load(f) or {}
-
     if not table:
         raise ValueError('table name must be provided')
-    if not database:
-        raise ValueError('database name must be provided')
 
     base_folder = base_folder_arg or os.getcwd()
     parts = [base_folder]
@@ -131,6 +128,17 @@ def import_performance_to_mysql(database: str, table: str, cfg_path: str = DEFAU
         logging.info('在 %s 中未找到 performance_summary csv 文件。', a_folder)
         return
 
+    import yaml
+    import pandas as pd
+    from importer import open_importer
+    from data_quality import SOURCE_COLUMN, quality_gate
+
+    with open(cfg_path, 'r', encoding='utf-8') as f:
+        cfg = yaml.safe_load(f) or {}
+    database = database or cfg.get('database6') or cfg.get('database')
+    if not database:
+        raise ValueError('database name must be provided')
+
     all_rows = []
     for csv in csvs:
         try:
@@ -144,6 +152,7 @@ def import_performance_to_mysql(database: str, table: str, cfg_path: str = DEFAU
             use_session = sub1
             df = read_summary_csv(csv, session_id=use_session, id_val=use_id)
             if not df.empty:
+                df[SOURCE_COLUMN] = csv
                 all_rows.append(df)
             else:
                 logging.warning('文件 %s 未包含可识别的性能列，已跳过', csv)
@@ -155,19 +164,17 @@ def import_performance_to_mysql(database: str, table: str, cfg_path: str = DEFAU
         return
 
     combined = pd.concat(all_rows, ignore_index=True)
-    logging.info('准备上传 %d 行到表 %s (database: %s)', len(combined), table, database)
-
-    importer = MySQLImporter(cfg_path)
     pk = cfg.get('pk', 'session_id,id,portfolio_name,')
     pk_fields = [p.strip() for p in pk.split(',') if p.strip()]
 
-    try:
-        importer.create_table(table, SCHEMA, pk_fields, db=database)
-    except Exception:
-        logging.exception('尝试创建表 %s.%s 时出错', database, table)
+    combined = quality_gate(combined, 'performance', pk_fields, table, cfg)
+    if combined.empty:
+        logging.info('没有通过数据质量检查的数据。')
+        return
+    logging.info('准备上传 %d 行到表 %s (database: %s)', len(combined), table, database)
 
-    importer.df_to_mysql(combined, table, SCHEMA, pk_fields, database=database)
-    importer.close()
+    with open_importer(cfg_path, importer) as importer:
+        importer.import_frame(combined, table, SCHEMA, pk_fields, database=database, source=a_folder)
 
 
 def main(database: str, table: str, sub1: str = None, base_folder_arg: str = None):
@@ -175,6 +182,8 @@ def main(database: str, table: str, sub1: str = None, base_folder_arg: str = Non
         import_performance_to_mysql(database=database, table=table, sub1=sub1, base_folder_arg=base_folder_arg)
     except Exception as e:
         logging.error('导入失败: %s', e)
+        return 1
+    return 0
 
 
 if __name__ == "__main__":
@@ -184,16 +193,12 @@ if __name__ == "__main__":
     parser.add_argument('base_folder', nargs='?', help='Base folder for backtest results (optional).')
     args = parser.parse_args()
 
-    cfg = {}
-    try:
-        if os.path.exists(DEFAULT_DB_CONFIG):
-            with open(DEFAULT_DB_CONFIG, 'r', encoding='utf-8') as f:
-                cfg = yaml.safe_load(f) or {}
-    except Exception:
-        logging.exception('读取默认配置文件失败: %s', DEFAULT_DB_CONFIG)
-
-    db_name = cfg.get('database6') or cfg.get('database')
-    main(db_name, args.table, args.sub1, args.base_folder)
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)-8s %(name)s: %(message)s",
+                        datefmt="%Y-%m-%d %H:%M:%S")
+
+    # database6 / database 从默认配置读取，找到待导入文件后才解析配置
+    sys.exit(main(None, args.table, args.sub1, args.base_folder))
 
 
 
@@ -0,0 +1,153 @@
+"""Long-lived local import service.
+
+run_backtest.m used to start three Python processes per run, each paying for interpreter
+startup, the pandas/SQLAlchemy imports, YAML parsing and engine creation. This service
+does that once and keeps one MySQLImporter (connection pool + information_schema cache)
+warm. Jobs arrive as one JSON line per connection on 127.0.0.1 and are run one at a time;
+the reply carries the job's log output so callers can print it like the scripts did.
+
+    {"job": "netvalue", "table": "u_backtest", "sid": "...", "base_folder": "..."}
+    {"job": "contributions", "table": "u_contribution", "weight_table": "...", "sid": "...", "base_folder": "..."}
+
+Start with `python import_service.py`, submit with import_client.py.
+"""
+from typing import TYPE_CHECKING, Dict, Optional
+import os
+import time
+import logging
+import argparse
+import threading
+import socketserver
+
+from import_client import DEFAULT_HOST, DEFAULT_PORT, JOB_ARGS, send_message, recv_message
+import import_netvalue_to_mysql
+import import_performance_to_mysql
+import import_contributions_to_mysql
+
+# 客户端回退到进程内执行时也会导入本模块，importer (pandas / SQLAlchemy) 只在服务启动或确有文件时加载
+if TYPE_CHECKING:
+    from importer import MySQLImporter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_CONFIG = os.path.abspath(os.path.join(os.path.dirname(__file__), 'config', 'db.yaml'))
+
+
+class _CaptureHandler(logging.Handler):
+    """Collect the formatted log lines emitted while one job runs."""
+
+    def __init__(self):
+        super().__init__(level=logging.INFO)
+        self.setFormatter(logging.Formatter("%(asctime)s %(levelname)-8s %(name)s: %(message)s",
+                                            datefmt="%Y-%m-%d %H:%M:%S"))
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+def _dispatch(message: Dict, cfg_path: str, importer: Optional['MySQLImporter']):
+    job = message.get('job')
+    if job not in JOB_ARGS:
+        raise ValueError(f'unknown job: {job}')
+    if not message.get('table'):
+        raise ValueError('table name must be provided')
+    # database=None：各导入函数在找到文件后按配置解析 database6
+    sid, base_folder = message.get('sid'), message.get('base_folder')
+
+    if job == 'netvalue':
+        import_netvalue_to_mysql.import_netvalues_to_mysql(None, message['table'], cfg_path=cfg_path,
+                                                           sub1=sid, base_folder_arg=base_folder, importer=importer)
+    elif job == 'performance':
+        import_performance_to_mysql.import_performance_to_mysql(None, message['table'], cfg_path=cfg_path, sub1=sid,
+                                                                base_folder_arg=base_folder, importer=importer)
+    else:
+        import_contributions_to_mysql.main(message['table'], message.get('weight_table'), sid, base_folder,
+                                           cfg_path=cfg_path, importer=importer)
+
+
+def run_job(message: Dict, importer: Optional['MySQLImporter'] = None, cfg_path: str = DEFAULT_DB_CONFIG,
+            capture: bool = True) -> Dict:
+    """Run one import job and return {'ok', 'output', 'elapsed'}.
+
+    Without an importer a temporary one is opened and closed by the import function, which
+    is what the client falls back to when the service is not running. With capture=False
+    the log goes straight to the console and 'output' stays empty.
+    """
+    handler = _CaptureHandler()
+    root = logging.getLogger()
+    if capture:
+        root.addHandler(handler)
+    start = time.perf_counter()
+    ok = True
+    try:
+        _dispatch(message, cfg_path, importer)
+    except Exception as e:
+        ok = False
+        logger.exception('导入失败: %s', e)
+    finally:
+        root.removeHandler(handler)
+    elapsed = time.perf_counter() - start
+    return {'ok': ok, 'output': '\n'.join(handler.lines), 'elapsed': round(elapsed, 3)}
+
+
+class ImportRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            message = recv_message(self.rfile)
+        except Exception as e:
+            send_message(self.connection, {'ok': False, 'output': f'bad request: {e}'})
+            return
+
+        job = message.get('job')
+        if job == 'ping':
+            send_message(self.connection, {'ok': True, 'output': 'pong'})
+            return
+        if job == 'shutdown':
+            send_message(self.connection, {'ok': True, 'output': 'shutting down'})
+            # shutdown() 会等待 serve_forever 返回，不能在处理请求的线程里直接调用
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return
+
+        logger.info('收到导入任务: %s', message)
+        reply = run_job(message, importer=self.server.importer, cfg_path=self.server.cfg_path)
+        logger.info('任务 %s 完成: ok=%s, 耗时 %.3fs', job, reply['ok'], reply['elapsed'])
+        send_message(self.connection, reply)
+
+
+class ImportServer(socketserver.TCPServer):
+    """Single-threaded on purpose: jobs share one importer and must not interleave."""
+
+    allow_reuse_address = True
+
+    def __init__(self, address, cfg_path: str = DEFAULT_DB_CONFIG):
+        from importer import MySQLImporter
+
+        self.cfg_path = cfg_path
+        self.importer = MySQLImporter(cfg_path, cache_metadata=True)
+        super().__init__(address, ImportRequestHandler)
+
+    def server_close(self):
+        super().server_close()
+        self.importer.close()
+
+
+def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, cfg_path: str = DEFAULT_DB_CONFIG):
+    with ImportServer((host, port), cfg_path) as server:
+        logger.info('导入服务已启动: %s:%d (config: %s)', host, port, cfg_path)
+        server.serve_forever(poll_interval=0.5)
+    logger.info('导入服务已停止')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)-8s %(name)s: %(message)s",
+                        datefmt="%Y-%m-%d %H:%M:%S")
+    parser = argparse.ArgumentParser(description='Serve import jobs on localhost with a warm MySQL importer.')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='Bind address (default: 127.0.0.1, local only).')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='TCP port (default: $BACKTEST_IMPORT_PORT or 8765).')
+    parser.add_argument('--config', default=DEFAULT_DB_CONFIG, help='Path to db.yaml.')
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.config)
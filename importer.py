@@ -1,26 +1,296 @@
 import pandas as pd
+import numpy as np
 import pymysql
-from sqlalchemy import create_engine, text, types
+from sqlalchemy import create_engine, text, types, exc as sa_exc
 import yaml
 from typing import Dict, List, Optional
+from contextlib import contextmanager
 import os
+import re
+import time
+import json
+import hashlib
+import datetime as dt
 import logging
 from logging import Logger
 logger: Logger = logging.getLogger(__name__)
 
+# 分区表的兜底分区名（VALUES LESS THAN MAXVALUE）
+PARTITION_MAX = 'pmax'
+
+
+def _partition_floor(d: dt.date, unit: str) -> dt.date:
+    """Return the first day of the month/year period containing d."""
+    if unit == 'year':
+        return dt.date(d.year, 1, 1)
+    return dt.date(d.year, d.month, 1)
+
+
+def _partition_next(d: dt.date, unit: str) -> dt.date:
+    """Return the first day of the period following the one starting at d."""
+    if unit == 'year':
+        return dt.date(d.year + 1, 1, 1)
+    if d.month == 12:
+        return dt.date(d.year + 1, 1, 1)
+    return dt.date(d.year, d.month + 1, 1)
+
+
+def _partition_name(d: dt.date, unit: str) -> str:
+    """Partition name for the period starting at d, e.g. p202501 / p2025."""
+    return f"p{d.year}" if unit == 'year' else f"p{d.year}{d.month:02d}"
+
+
+def _partition_clause(bounds, unit: str, with_max: bool = True) -> str:
+    """Build partition definitions for the periods starting at `bounds`, followed by pmax."""
+    parts = [
+        f"PARTITION {_partition_name(b, unit)} VALUES LESS THAN ('{_partition_next(b, unit).isoformat()}')"
+        for b in bounds
+    ]
+    if with_max:
+        parts.append(f"PARTITION {PARTITION_MAX} VALUES LESS THAN (MAXVALUE)")
+    return ',\n            '.join(parts)
+
+
+def _partition_range(start: dt.date, stop: dt.date, unit: str) -> List[dt.date]:
+    """Period starts from start (inclusive) up to stop (exclusive)."""
+    bounds = []
+    b = start
+    while b < stop:
+        bounds.append(b)
+        b = _partition_next(b, unit)
+    return bounds
+
+
+# 默认的导入断点文件：记录每个 (数据源, 表) 已提交的分块数
+DEFAULT_CHECKPOINT_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), 'logs', 'import_checkpoints.json'))
+
+# 可重试的 MySQL 错误：连接断开 / 超时 / 锁等待 / 死锁
+TRANSIENT_MYSQL_ERRORS = {2003, 2006, 2013, 2055, 1205, 1213}
+
+
+def _is_transient_error(e: BaseException) -> bool:
+    """True for errors worth retrying on a fresh connection (dropped connections, deadlocks)."""
+    if isinstance(e, sa_exc.DBAPIError):
+        if e.connection_invalidated:
+            return True
+        e = e.orig
+    if isinstance(e, (sa_exc.DisconnectionError, pymysql.err.InterfaceError, ConnectionError)):
+        return True
+    if isinstance(e, (pymysql.err.OperationalError, pymysql.err.InternalError)):
+        return bool(e.args) and e.args[0] in TRANSIENT_MYSQL_ERRORS
+    return False
+
+
+class ImportCheckpoint:
+    """Local JSON state recording how many chunks of an import have been committed.
+
+    Entries are keyed by "<db>.<table>|<source>" and carry a fingerprint of the prepared
+    rows, so a resumed run only skips chunks when it is importing the same data.
+    """
+
+    def __init__(self, path: str = DEFAULT_CHECKPOINT_FILE):
+        self.path = path
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _dump(self, state: Dict):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+
+    def committed_chunks(self, key: str, fingerprint: str) -> int:
+        entry = self._load().get(key)
+        if not entry or entry.get('fingerprint') != fingerprint:
+            return 0
+        return int(entry.get('chunks_done', 0))
+
+    def save(self, key: str, fingerprint: str, chunks_done: int, n_chunks: int):
+        state = self._load()
+        state[key] = {'fingerprint': fingerprint, 'chunks_done': chunks_done, 'n_chunks': n_chunks,
+                      'updated': dt.datetime.now().isoformat(timespec='seconds')}
+        self._dump(state)
+
+    def clear(self, key: str):
+        state = self._load()
+        if state.pop(key, None) is not None:
+            self._dump(state)
+
+
+# 行哈希列：diff 模式下只写入新增或内容有变化的行
+ROW_HASH_COLUMN = 'row_hash'
+
+
+def _key_strings(df: pd.DataFrame, key_fields: List[str], schema: List[Dict]) -> pd.DataFrame:
+    """Render key columns as canonical strings according to their MySQL column types.
+
+    Used to match incoming keys against keys read back from MySQL: DECIMAL(p,s) is formatted
+    with s decimals (0.0001 and Decimal('0.00010000') both become '0.00010000'), other numbers
+    via their numeric value, DATE / DATETIME in ISO format.
+    """
+    types_by_field = {c['field']: c['type'].upper() for c in schema}
+    out = pd.DataFrame(index=df.index)
+    for k in key_fields:
+        col, mysql_type = df[k], types_by_field.get(k, '')
+        if 'DECIMAL' in mysql_type:
+            m = re.search(r'DECIMAL\s*\(\s*\d+\s*,\s*(\d+)\s*\)', mysql_type)
+            scale = int(m.group(1)) if m else 0
+            num = pd.to_numeric(col, errors='coerce').astype(float).round(scale)
+            out[k] = num.map(lambda x: '' if pd.isna(x) else f'{x:.{scale}f}')
+        elif 'INT' in mysql_type:
+            out[k] = pd.to_numeric(col, errors='coerce').astype('Int64').astype(str)
+        elif 'FLOAT' in mysql_type or 'DOUBLE' in mysql_type:
+            num = pd.to_numeric(col, errors='coerce').astype(float)
+            out[k] = num.map(lambda x: '' if pd.isna(x) else f'{x:.15g}')
+        elif 'DATETIME' in mysql_type or 'TIMESTAMP' in mysql_type:
+            out[k] = pd.to_datetime(col, errors='coerce').dt.strftime('%Y-%m-%d %H:%M:%S')
+        elif mysql_type.startswith('DATE'):
+            out[k] = pd.to_datetime(col, errors='coerce').dt.strftime('%Y-%m-%d')
+        else:
+            out[k] = col.astype(str)
+    return out
+
+# 每个用户一套结果表：<user_name><suffix>；汇总表去掉用户名前缀，用 user_name 列区分用户
+RESULT_TABLE_SUFFIXES = ('_backtest_performance', '_contribution_weight', '_contribution', '_backtest')
+TABLE_LAYOUTS = ('per_user', 'consolidated', 'dual')
+
+# 贡献度表的自然键：未配置 pk 时用作主键，使分块重试 / 断点续传时重复写入的行被 upsert 合并
+CONTRIBUTION_KEY_FIELDS = ['session_id', 'id', 'portfolio_name', 'valuation_date']
+
+
+def split_user_table(table_name: str):
+    """Split a per-user result table name into (user_name, consolidated table name).
+
+    Returns (None, table_name) when the name does not follow the per-user convention.
+    """
+    for suffix in RESULT_TABLE_SUFFIXES:
+        if table_name.endswith(suffix) and len(table_name) > len(suffix):
+            return table_name[: -len(suffix)], suffix[1:]
+    return None, table_name
+
+
+def resolve_target_tables(table_name: str, layout: Optional[str] = None):
+    """Return the [(table, user_name)] pairs an import of `table_name` should write to.
+
+    layout: 'per_user' (default) writes the given table only, 'consolidated' writes the
+    shared table with a user_name column, 'dual' writes both (used while migrating).
+    """
+    layout = layout or 'per_user'
+    if layout not in TABLE_LAYOUTS:
+        raise ValueError(f"table_layout 只支持 {', '.join(TABLE_LAYOUTS)}: {layout}")
+    user_name, shared = split_user_table(table_name)
+    if layout == 'per_user' or user_name is None:
+        return [(table_name, None)]
+    if layout == 'consolidated':
+        return [(shared, user_name)]
+    return [(table_name, None), (shared, user_name)]
+
+
+def with_user_name(df: pd.DataFrame, schema: List[Dict], pk_fields: List[str], user_name: Optional[str]):
+    """Add a leading user_name column to df/schema/pk for the consolidated layout.
+
+    Returns (df, schema, pk_fields, index_fields); inputs are returned unchanged when
+    user_name is None.
+    """
+    if user_name is None:
+        return df, schema, pk_fields, None
+    df = df.copy()
+    df.insert(0, 'user_name', str(user_name))
+    schema = [{'field': 'user_name', 'type': 'VARCHAR(100)'}] + [c for c in schema if c['field'] != 'user_name']
+    pk_fields = ['user_name'] + [k for k in pk_fields if k != 'user_name'] if pk_fields else []
+    index_fields = [['user_name', 'session_id']] if any(c['field'] == 'session_id' for c in schema) else None
+    return df, schema, pk_fields, index_fields
+
+
+@contextmanager
+def open_importer(config_path: str, importer: Optional['MySQLImporter'] = None):
+    """Yield `importer` when given (e.g. shared by the import service), else a temporary one closed on exit."""
+    if importer is not None:
+        yield importer
+        return
+    importer = MySQLImporter(config_path)
+    try:
+        yield importer
+    finally:
+        importer.close()
+
 
 class MySQLImporter:
-    def __init__(self, config_path):
+    def __init__(self, config_path, cache_metadata: bool = False):
         with open(config_path, 'r') as f:
             self.config = yaml.safe_load(f)
 
         self.engine = create_engine(
             f"mysql+pymysql://{self.config['user2']}:{self.config['password']}"
-            f"@{self.config['host']}:{self.config['port']}/{self.config['database']}"
+            f"@{self.config['host']}:{self.config['port']}/{self.config['database']}",
+            pool_pre_ping=True,
         )
-        
-    
-    def create_table(self, table_name, schema, pk_fields, db: Optional[str] = None):
+
+        # 分块提交与断点续传：chunk_size 行一个事务，瞬时错误按指数退避重试
+        self.chunk_size = int(self.config.get('chunk_size', 20000))
+        self.max_retries = int(self.config.get('import_retries', 3))
+        self.retry_backoff = float(self.config.get('import_retry_backoff', 2.0))
+        self.checkpoint = ImportCheckpoint(self.config.get('checkpoint_file', DEFAULT_CHECKPOINT_FILE))
+
+        # 可选的按日期 RANGE 分区：partition_by 为 month / year，未配置时建普通表
+        self.partition_by = self.config.get('partition_by')
+        if self.partition_by and self.partition_by not in ('month', 'year'):
+            raise ValueError(f"partition_by 只支持 month 或 year: {self.partition_by}")
+        self.partition_column = self.config.get('partition_column', 'valuation_date')
+        self.partition_lookahead = int(self.config.get('partition_lookahead', 2))
+        self.partition_retention = self.config.get('partition_retention')
+        self.partition_archive_db = self.config.get('partition_archive_db')
+
+        # 常驻导入服务复用同一个实例时缓存 information_schema 查询结果（表是否存在 / 列 / 主键）
+        self.cache_metadata = cache_metadata
+        self._meta_cache: Dict[tuple, object] = {}
+
+    def _cached_meta(self, kind: str, db: str, table_name: str, loader):
+        if not self.cache_metadata:
+            return loader()
+        key = (kind, db, table_name)
+        if key not in self._meta_cache:
+            value = loader()
+            # 不存在的表不缓存，其他进程随时可能建表
+            if kind == 'exists' and not value:
+                return value
+            self._meta_cache[key] = value
+        return self._meta_cache[key]
+
+    def invalidate_metadata(self, table_name: Optional[str] = None, db: Optional[str] = None):
+        """Drop cached metadata for one table, or everything when table_name is None."""
+        if table_name is None:
+            self._meta_cache.clear()
+            return
+        for key in [k for k in self._meta_cache if k[2] == table_name and (db is None or k[1] == db)]:
+            del self._meta_cache[key]
+
+    def _partition_enabled(self, schema) -> bool:
+        """Partitioning applies only when configured and the schema has the partition column."""
+        return bool(self.partition_by) and any(c['field'] == self.partition_column for c in schema)
+
+    def _partition_pk(self, pk_fields, schema):
+        """MySQL requires every unique key of a partitioned table to contain the partition column."""
+        pk_fields = list(pk_fields or [])
+        if pk_fields and self._partition_enabled(schema) and self.partition_column not in pk_fields:
+            pk_fields.append(self.partition_column)
+        return pk_fields
+
+    def create_table(self, table_name, schema, pk_fields, db: Optional[str] = None,
+                     index_fields: Optional[List[List[str]]] = None):
+
+        # 缓存中已确认存在的表不再发 CREATE，也不作废其缓存（导入脚本每个任务都会调用 create_table）
+        if db and self.cache_metadata and self._meta_cache.get(('exists', db, table_name)):
+            return
+
+        partitioned = self._partition_enabled(schema)
+        pk_fields = self._partition_pk(pk_fields, schema)
 
         columns = []
         for col_def in schema:
@@ -34,6 +304,11 @@ class MySQLImporter:
             pk_cols = ', '.join([f"`{c}`" for c in pk_fields])
             pk_clause = f",\n            PRIMARY KEY ({pk_cols})"
 
+        # 额外的二级索引，例如汇总表的 (user_name, session_id)
+        for idx in index_fields or []:
+            idx_cols = ', '.join([f"`{c}`" for c in idx])
+            pk_clause += f",\n            KEY `idx_{'_'.join(idx)}` ({idx_cols})"
+
         # 生成CREATE TABLE语句
         create_sql = f"""
         CREATE TABLE IF NOT EXISTS `{table_name}` (
@@ -41,6 +316,11 @@ class MySQLImporter:
         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
         """
 
+        # 分区表先只建 pmax，具体月/年分区由 maintain_partitions 在导入前按数据日期补齐
+        if partitioned:
+            create_sql += (f"PARTITION BY RANGE COLUMNS(`{self.partition_column}`) (\n"
+                           f"            {_partition_clause([], self.partition_by)}\n        )\n")
+
         # If db provided, qualify table with database name
         if db:
             create_sql = create_sql.replace(f"CREATE TABLE IF NOT EXISTS `{table_name}`", f"CREATE TABLE IF NOT EXISTS `{db}`.`{table_name}`")
@@ -48,10 +328,14 @@ class MySQLImporter:
         # use a transaction when creating the table
         with self.engine.begin() as conn:
             conn.execute(text(create_sql))
+        self.invalidate_metadata(table_name, db=db)
 
     def _table_exists(self, table_name, db: Optional[str] = None):
         if db is None:
             db = self.config['database4']
+        return self._cached_meta('exists', db, table_name, lambda: self._query_table_exists(table_name, db))
+
+    def _query_table_exists(self, table_name, db: str):
         sql = text("SELECT COUNT(*) AS cnt FROM information_schema.tables WHERE table_schema = :db AND table_name = :tbl")
         with self.engine.connect() as conn:
             # use scalar() to get the first column of the first row (count)
@@ -67,6 +351,9 @@ class MySQLImporter:
     def _get_table_pk_columns(self, table_name, db: Optional[str] = None):
         if db is None:
             db = self.config['database']
+        return list(self._cached_meta('pk', db, table_name, lambda: self._query_table_pk_columns(table_name, db)))
+
+    def _query_table_pk_columns(self, table_name, db: str):
         sql = text("SELECT COLUMN_NAME FROM information_schema.KEY_COLUMN_USAGE "
                    "WHERE TABLE_SCHEMA = :db AND TABLE_NAME = :tbl AND CONSTRAINT_NAME = 'PRIMARY' "
                    "ORDER BY ORDINAL_POSITION")
@@ -96,10 +383,122 @@ class MySQLImporter:
                 # If the query fails (e.g., permission issues), return a conservative non-zero value to prevent inserts
                 return 1
 
+    def _get_partition_bounds(self, table_name, db: Optional[str] = None):
+        """Return {partition_name: upper bound date} for the RANGE partitions of a table.
+
+        pmax is reported with a bound of None; a non-partitioned table returns {}.
+        """
+        if db is None:
+            db = self.config['database']
+        sql = text("SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+                   "WHERE TABLE_SCHEMA = :db AND TABLE_NAME = :tbl AND PARTITION_NAME IS NOT NULL "
+                   "ORDER BY PARTITION_ORDINAL_POSITION")
+        with self.engine.connect() as conn:
+            res = conn.execute(sql, {'db': db, 'tbl': table_name}).fetchall()
+        bounds = {}
+        for name, desc in res:
+            desc = str(desc).strip("'")
+            bounds[name] = None if desc.upper() == 'MAXVALUE' else dt.date.fromisoformat(desc)
+        return bounds
+
+    def _retention_cutoff(self) -> Optional[dt.date]:
+        """Start of the oldest period kept by `partition_retention` (None keeps everything)."""
+        if self.partition_retention is None:
+            return None
+        cutoff = _partition_floor(dt.date.today(), self.partition_by)
+        for _ in range(int(self.partition_retention)):
+            cutoff = _partition_floor(cutoff - dt.timedelta(days=1), self.partition_by)
+        return cutoff
+
+    def maintain_partitions(self, table_name, through_date, from_date=None, db: Optional[str] = None,
+                            expire: bool = True):
+        """Add partitions covering from_date .. through_date (+ lookahead) and drop or archive expired ones.
+
+        New partitions are split out of the empty pmax catch-all, so adding them is a
+        metadata-only operation as long as imports stay ahead of the calendar. When from_date
+        is older than the first partition, that partition is split into per-period partitions
+        (this copies the rows of the first partition only). With expire=True, partitions whose
+        whole range is older than `partition_retention` periods are dropped afterwards (see
+        expire_partitions); df_to_mysql passes expire=False and expires after the insert.
+        """
+        if db is None:
+            db = self.config['database']
+        unit = self.partition_by
+        if not unit:
+            return
+        bounds = self._get_partition_bounds(table_name, db=db)
+        if PARTITION_MAX not in bounds:
+            # 非分区表（或非本工具创建的分区表），不做维护
+            return
+
+        dated = sorted(b for b in bounds.values() if b is not None)
+        through = pd.Timestamp(through_date).date()
+        target = _partition_floor(through, unit)
+        for _ in range(self.partition_lookahead):
+            target = _partition_next(target, unit)
+        low = _partition_floor(pd.Timestamp(from_date).date() if from_date is not None else through, unit)
+        cutoff = self._retention_cutoff()
+        if cutoff is not None and low < cutoff:
+            # 保留期之前的分区建了也会马上被删除
+            low = cutoff
+
+        with self.engine.begin() as conn:
+            new_bounds = _partition_range(dated[-1] if dated else low, _partition_next(target, unit), unit)
+            if new_bounds:
+                conn.execute(text(
+                    f"ALTER TABLE `{db}`.`{table_name}` REORGANIZE PARTITION {PARTITION_MAX} INTO (\n"
+                    f"            {_partition_clause(new_bounds, unit)}\n        )"
+                ))
+                logger.info("为 %s.%s 新增 %d 个分区 (%s ~ %s)", db, table_name, len(new_bounds),
+                            _partition_name(new_bounds[0], unit), _partition_name(new_bounds[-1], unit))
+
+            if dated:
+                # 第一个分区没有下界，早于它的行都会落进去；回测起始日期更早时按周期拆分，保证分区裁剪和按期删除
+                first_upper = dated[0]
+                first_name = next(name for name, upper in bounds.items() if upper == first_upper)
+                first_start = _partition_floor(first_upper - dt.timedelta(days=1), unit)
+                lower_bounds = _partition_range(low, first_start, unit)
+                if lower_bounds:
+                    conn.execute(text(
+                        f"ALTER TABLE `{db}`.`{table_name}` REORGANIZE PARTITION {first_name} INTO (\n"
+                        f"            {_partition_clause(lower_bounds, unit, with_max=False)},\n"
+                        f"            PARTITION {first_name} VALUES LESS THAN ('{first_upper.isoformat()}')\n        )"
+                    ))
+                    logger.info("为 %s.%s 向前拆分 %d 个分区 (%s ~ %s)", db, table_name, len(lower_bounds),
+                                _partition_name(lower_bounds[0], unit), _partition_name(lower_bounds[-1], unit))
+
+        if expire:
+            self.expire_partitions(table_name, db=db)
+
+    def expire_partitions(self, table_name, db: Optional[str] = None):
+        """Drop (or archive to `partition_archive_db`, then drop) partitions older than `partition_retention`."""
+        if db is None:
+            db = self.config['database']
+        cutoff = self._retention_cutoff() if self.partition_by else None
+        if cutoff is None:
+            return
+        bounds = self._get_partition_bounds(table_name, db=db)
+        expired = [name for name, upper in bounds.items() if upper is not None and upper <= cutoff]
+        if not expired:
+            return
+        with self.engine.begin() as conn:
+            for name in expired:
+                if self.partition_archive_db:
+                    archive = self.partition_archive_db
+                    conn.execute(text(f"CREATE TABLE IF NOT EXISTS `{archive}`.`{table_name}` LIKE `{db}`.`{table_name}`"))
+                    conn.execute(text(f"INSERT IGNORE INTO `{archive}`.`{table_name}` "
+                                      f"SELECT * FROM `{db}`.`{table_name}` PARTITION ({name})"))
+                conn.execute(text(f"ALTER TABLE `{db}`.`{table_name}` DROP PARTITION {name}"))
+                logger.info("已%s过期分区 %s.%s/%s", '归档并删除' if self.partition_archive_db else '删除',
+                            db, table_name, name)
+
     def _get_table_columns(self, table_name, db: Optional[str] = None):
         """Return a set of column names that exist in the given table."""
         if db is None:
             db = self.config['database']
+        return set(self._cached_meta('columns', db, table_name, lambda: self._query_table_columns(table_name, db)))
+
+    def _query_table_columns(self, table_name, db: str):
         sql = text("SELECT COLUMN_NAME FROM information_schema.columns WHERE TABLE_SCHEMA = :db AND TABLE_NAME = :tbl")
         with self.engine.connect() as conn:
             res = conn.execute(sql, {'db': db, 'tbl': table_name}).fetchall()
@@ -113,11 +512,79 @@ class MySQLImporter:
                     cols.add(name)
             return cols
         
-    def df_to_mysql(self, df, table_name, schema, pk_fields: Optional[List[str]] = None, database: Optional[str] = None):
+    def _row_hash(self, df: pd.DataFrame, key_fields: List[str]) -> pd.Series:
+        """Vectorized 64-bit hash of the non-key columns of each row.
+
+        update_time is excluded so that re-importing identical results hashes identically.
+        """
+        value_cols = sorted(c for c in df.columns if c not in key_fields and c not in (ROW_HASH_COLUMN, 'update_time'))
+        if not value_cols:
+            return pd.Series(np.zeros(len(df), dtype='uint64'), index=df.index)
+        return pd.util.hash_pandas_object(df[value_cols], index=False)
+
+    def _fetch_row_hashes(self, table_name, key_fields: List[str], df: pd.DataFrame, db: str) -> pd.DataFrame:
+        """Fetch key -> row_hash pairs for the incoming key range in one query.
+
+        Each key column is bounded by the min/max of the incoming frame (equality when the
+        frame holds a single value), so the lookup is served by the primary key index.
+        """
+        conds, bind = [], {}
+        for i, k in enumerate(key_fields):
+            vals = df[k].dropna()
+            if vals.empty:
+                continue
+            lo, hi = vals.min(), vals.max()
+            if lo == hi:
+                conds.append(f"`{k}` = :lo{i}")
+            else:
+                conds.append(f"`{k}` BETWEEN :lo{i} AND :hi{i}")
+                bind[f"hi{i}"] = hi
+            bind[f"lo{i}"] = lo
+        keys = ', '.join([f"`{k}`" for k in key_fields])
+        where = f" WHERE {' AND '.join(conds)}" if conds else ''
+        sql = text(f"SELECT {keys}, `{ROW_HASH_COLUMN}` FROM `{db}`.`{table_name}`{where}")
+        with self.engine.connect() as conn:
+            rows = conn.execute(sql, bind).fetchall()
+        return pd.DataFrame([tuple(r) for r in rows], columns=key_fields + [ROW_HASH_COLUMN])
+
+    def import_frame(self, df, table_name, schema, pk_fields: Optional[List[str]] = None,
+                     database: Optional[str] = None, source: Optional[str] = None):
+        """Create and fill every table an import of `table_name` writes to under `table_layout`.
+
+        Resolves the targets with resolve_target_tables (per_user / consolidated / dual), adds
+        the user_name column for the consolidated table and hands each target to df_to_mysql.
+        An existing table without a primary key is imported without one. Returns
+        {target: df_to_mysql result}.
+        """
+        results = {}
+        for target, user_name in resolve_target_tables(table_name, self.config.get('table_layout')):
+            df_t, schema_t, pk_t, idx_t = with_user_name(df, schema, pk_fields or [], user_name)
+            if pk_t and self._table_exists(target, db=database) and not self._get_table_pk_columns(target, db=database):
+                # 旧版本建的无主键表：按无主键导入（重复数据需先清理并补建主键，见 README）
+                logger.warning("表 %s.%s 没有主键，按无主键方式导入", database, target)
+                pk_t = []
+            try:
+                self.create_table(target, schema_t, pk_t, db=database, index_fields=idx_t)
+            except Exception:
+                logger.exception("尝试创建表 %s.%s 时出错", database, target)
+            results[target] = self.df_to_mysql(df_t, target, schema_t, pk_t, database=database, source=source)
+        return results
+
+    def df_to_mysql(self, df, table_name, schema, pk_fields: Optional[List[str]] = None, database: Optional[str] = None,
+                    diff: Optional[bool] = None, source: Optional[str] = None):
         """Insert or upsert a DataFrame into a MySQL table.
 
         database: optional. If equals a key in the loaded config (e.g. 'database2'), the mapped value
                   from config is used; otherwise the provided string is treated as a literal database name.
+        diff: optional. When true (default: `upsert_mode: diff` in config) a row_hash column is
+              stored and only new or changed rows are sent. Requires pk_fields.
+        source: optional. Identifies the imported files (e.g. the base folder); when given, rows are
+                committed in chunk_size chunks and progress is checkpointed so a failed import
+                resumes from the first uncommitted chunk on the next run.
+
+        Returns a dict with inserted / updated / unchanged row counts (None if nothing was written);
+        the counts are only known in diff mode and are None otherwise.
+        A chunk that still fails after the retries is re-raised once the checkpoint is saved.
         """
         # resolve target_db
         if database is not None and database in self.config:
@@ -127,13 +594,22 @@ class MySQLImporter:
         else:
             target_db = self.config['database']
 
+        if diff is None:
+            diff = self.config.get('upsert_mode') == 'diff'
+        key_fields = self._partition_pk(pk_fields, schema)
+        if diff and not key_fields:
+            logger.info("表 %s 未指定主键，无法按行哈希比对，改为全量 upsert", table_name)
+            diff = False
+        if diff and not any(c['field'] == ROW_HASH_COLUMN for c in schema):
+            schema = list(schema) + [{'field': ROW_HASH_COLUMN, 'type': 'BIGINT UNSIGNED'}]
+
         df_clean = self._preprocess_data(df, schema)
-        key_fields = pk_fields if pk_fields else []
 
         # create table if not exists in target_db
         if not self._table_exists(table_name, db=target_db):
             self.create_table(table_name, schema, pk_fields, db=target_db)
             table_created = True
+            pk_cols = key_fields
         else:
             table_created = False
             pk_cols = self._get_table_pk_columns(table_name, db=target_db)
@@ -147,12 +623,22 @@ class MySQLImporter:
             if 'update_time' in df_clean.columns:
                 try:
                     df_clean['update_time'] = pd.to_datetime(df_clean['update_time'])
-                    df_clean = df_clean.sort_values('update_time').drop_duplicates(subset=key_fields, keep='last')
+                    df_clean = df_clean.sort_values('update_time', kind='stable').drop_duplicates(subset=key_fields, keep='last')
                 except Exception:
                     df_clean = df_clean.drop_duplicates(subset=key_fields, keep='last')
             else:
                 df_clean = df_clean.drop_duplicates(subset=key_fields, keep='last')
 
+        partitioned = self._partition_enabled(schema) and self.partition_column in df_clean.columns
+        cutoff = self._retention_cutoff() if partitioned else None
+        if cutoff is not None:
+            # 早于保留期的行写入后会随过期分区一起被删除，在任何 DDL 之前直接跳过
+            expired = (pd.to_datetime(df_clean[self.partition_column], errors='coerce') < pd.Timestamp(cutoff)).to_numpy()
+            if expired.any():
+                logger.warning("%s.%s: %d 行早于分区保留期起点 %s，不导入", target_db, table_name,
+                               int(expired.sum()), cutoff.isoformat())
+                df_clean = df_clean[~expired]
+
         records = df_clean.to_dict(orient='records')
         if not records:
             logger.info("没有要插入的数据")
@@ -165,6 +651,16 @@ class MySQLImporter:
         else:
             existing_cols = self._get_table_columns(table_name, db=target_db) if self._table_exists(table_name, db=target_db) else set()
 
+        if partitioned:
+            dates = df_clean[self.partition_column].dropna()
+            if not dates.empty:
+                try:
+                    # 过期分区在写入之后再清理
+                    self.maintain_partitions(table_name, dates.max(), from_date=dates.min(), db=target_db, expire=False)
+                except Exception:
+                    # 分区维护失败不影响导入：超出范围的行会落入 pmax
+                    logger.exception("维护分区失败: %s.%s", target_db, table_name)
+
         missing = [f for f in schema_cols.keys() if f not in existing_cols]
         if missing:
             with self.engine.connect() as conn:
@@ -175,8 +671,28 @@ class MySQLImporter:
                         conn.execute(text(alter_sql))
                     except Exception as e:
                         raise RuntimeError(f"无法为表 {table_name} 添加列 {m}: {e}")
+            self.invalidate_metadata(table_name, db=target_db)
             existing_cols = self._get_table_columns(table_name, db=target_db)
 
+        # 全量 upsert 时无法区分新增和更新，只有 diff 模式给出分类计数
+        stats = {'inserted': None, 'updated': None, 'unchanged': None}
+        if diff:
+            df_clean[ROW_HASH_COLUMN] = self._row_hash(df_clean, key_fields).to_numpy()
+            existing = self._fetch_row_hashes(table_name, key_fields, df_clean, target_db)
+            # 主键按列类型转成统一的字符串再比对（DECIMAL 按小数位数、DATE 按 ISO 格式），避免两侧表示不同
+            old = _key_strings(existing, key_fields, schema)
+            old[ROW_HASH_COLUMN] = pd.array(existing[ROW_HASH_COLUMN].tolist(), dtype='UInt64')
+            old = old.drop_duplicates(subset=key_fields, keep='last')
+            merged = _key_strings(df_clean, key_fields, schema).merge(old, on=key_fields, how='left', indicator=True)
+            is_new = (merged['_merge'] == 'left_only').to_numpy()
+            same = (merged[ROW_HASH_COLUMN] == df_clean[ROW_HASH_COLUMN].to_numpy()).fillna(False).to_numpy(dtype=bool)
+            stats = {'inserted': int(is_new.sum()), 'updated': int((~is_new & ~same).sum()), 'unchanged': int(same.sum())}
+            df_clean = df_clean[~same]
+            records = df_clean.to_dict(orient='records')
+            if not records:
+                logger.info("%s.%s 无变化 (%d 行未变)", target_db, table_name, stats['unchanged'])
+                return stats
+
         cols = list(df_clean.columns)
         col_list_sql = ', '.join([f"`{c}`" for c in cols])
         driver_placeholders = ', '.join(['%s'] * len(cols))
@@ -204,26 +720,102 @@ class MySQLImporter:
 
         param_tuples = [tuple(_sanitize_value(rec[c]) for c in cols) for rec in records]
 
-        try:
+        # diff 模式下每次运行待写入的行集合会随已提交的行变化，本身即可续传，不使用分块断点
+        # 无主键的表重放分块会产生重复行：提交时断连不重试
+        idempotent = bool(pk_cols)
+        if not idempotent:
+            logger.warning("表 %s.%s 没有主键，中断后续传可能重复写入最后一个分块", target_db, table_name)
+        ckpt_key = f"{target_db}.{table_name}|{source}" if source and not diff else None
+        fingerprint = self._frame_fingerprint(df_clean) if ckpt_key else ''
+        chunks = [param_tuples[i:i + self.chunk_size] for i in range(0, len(param_tuples), self.chunk_size)]
+        start = self.checkpoint.committed_chunks(ckpt_key, fingerprint) if ckpt_key else 0
+        if start:
+            logger.info("从断点续传 %s.%s: 跳过已提交的 %d/%d 个分块", target_db, table_name, start, len(chunks))
+
+        written = 0
+        for i in range(start, len(chunks)):
+            try:
+                self._execute_chunk(insert_sql, chunks[i], idempotent=idempotent)
+            except Exception as e:
+                # 已提交的分块已记录在断点文件中；异常继续抛出，调用方据此报告导入失败
+                logger.error("导入 %s.%s 失败 (分块 %d/%d，已提交的分块下次运行时跳过): %s",
+                             target_db, table_name, i + 1, len(chunks), e)
+                raise
+            written += len(chunks[i])
+            if ckpt_key:
+                self.checkpoint.save(ckpt_key, fingerprint, i + 1, len(chunks))
+
+        if ckpt_key:
+            self.checkpoint.clear(ckpt_key)
+        if partitioned:
+            try:
+                self.expire_partitions(table_name, db=target_db)
+            except Exception:
+                logger.exception("清理过期分区失败: %s.%s", target_db, table_name)
+        if diff:
+            logger.info("导入 %d 行到 %s.%s (新增 %d, 更新 %d, 未变 %d)", written, target_db, table_name,
+                        stats['inserted'], stats['updated'], stats['unchanged'])
+        else:
+            logger.info("导入 %d 行到 %s.%s", written, target_db, table_name)
+        return stats
+
+    @staticmethod
+    def _frame_fingerprint(df: pd.DataFrame) -> str:
+        """Stable digest of the rows to import (update_time excluded, it changes every run)."""
+        cols = [c for c in df.columns if c != 'update_time']
+        digest = hashlib.sha1(','.join(cols).encode('utf-8'))
+        if cols and len(df):
+            digest.update(pd.util.hash_pandas_object(df[cols], index=False).to_numpy().tobytes())
+        return digest.hexdigest()
+
+    def _execute_chunk(self, insert_sql: str, params: List[tuple], idempotent: bool = True):
+        """Run one executemany + commit, retrying transient errors on a fresh pooled connection.
+
+        A connection lost during commit() may still have committed on the server. Replaying
+        the chunk is harmless when the table has a key to upsert on (idempotent=True); for
+        tables without a key it would duplicate the rows, so such errors are not retried.
+        """
+        attempt = 0
+        while True:
             raw_conn = self.engine.raw_connection()
+            cur = None
+            committing = False
             try:
                 cur = raw_conn.cursor()
-                cur.executemany(insert_sql, param_tuples)
+                cur.executemany(insert_sql, params)
+                committing = True
                 raw_conn.commit()
-                logger.info(f"导入 %d 行到 %s.%s", len(param_tuples), target_db, table_name)
+                return
+            except Exception as e:
+                try:
+                    raw_conn.rollback()
+                except Exception:
+                    pass
+                if not _is_transient_error(e) or attempt >= self.max_retries:
+                    raise
+                if committing and not idempotent:
+                    logger.error("提交分块时连接中断，无主键表无法确认是否已写入，不再重试")
+                    raise
+                # 连接已不可用，作废后由连接池重新建立
+                try:
+                    raw_conn.invalidate()
+                except Exception:
+                    pass
+                delay = self.retry_backoff ** attempt
+                attempt += 1
+                logger.warning("写入分块出错，%.1f 秒后第 %d 次重试: %s", delay, attempt, e)
+                time.sleep(delay)
             finally:
                 try:
-                    cur.close()
+                    if cur is not None:
+                        cur.close()
                 except Exception:
                     pass
                 try:
                     raw_conn.close()
                 except Exception:
                     pass
-        except Exception as e:
-            # Log full exception with stacktrace so it's visible in logs
-            logger.exception("导入 失败: %s", e)
-    
+
     def _preprocess_data(self, df: pd.DataFrame, schema: List[Dict]) -> pd.DataFrame:
         """
         数据预处理：确保数据类型匹配
@@ -0,0 +1,229 @@
+from typing import TYPE_CHECKING, Dict, List, Optional
+import os
+import time
+import logging
+import argparse
+
+# pandas / yaml / importer (SQLAlchemy) 在用到时才加载，与导入脚本一致
+if TYPE_CHECKING:
+    from importer import MySQLImporter
+
+DEFAULT_DB_CONFIG = os.path.abspath(os.path.join(os.path.dirname(__file__), 'config', 'db.yaml'))
+
+
+def discover_user_tables(importer: 'MySQLImporter', database: str, users: Optional[List[str]] = None):
+    """Return [(source table, user_name, consolidated table)] for the per-user result tables in database."""
+    from sqlalchemy import text
+    from importer import split_user_table
+
+    sql = text("SELECT TABLE_NAME FROM information_schema.tables WHERE TABLE_SCHEMA = :db ORDER BY TABLE_NAME")
+    with importer.engine.connect() as conn:
+        names = [row[0] for row in conn.execute(sql, {'db': database}).fetchall()]
+    found = []
+    for name in names:
+        user_name, shared = split_user_table(name)
+        if user_name is None:
+            continue
+        if users and user_name not in users:
+            continue
+        found.append((name, user_name, shared))
+    return found
+
+
+def get_table_schema(importer: 'MySQLImporter', table_name: str, database: str) -> List[Dict]:
+    from sqlalchemy import text
+
+    sql = text("SELECT COLUMN_NAME, COLUMN_TYPE FROM information_schema.columns "
+               "WHERE TABLE_SCHEMA = :db AND TABLE_NAME = :tbl ORDER BY ORDINAL_POSITION")
+    with importer.engine.connect() as conn:
+        res = conn.execute(sql, {'db': database, 'tbl': table_name}).fetchall()
+    return [{'field': name, 'type': typ} for name, typ in res]
+
+
+def _key_batches(importer: 'MySQLImporter', src: str, database: str, pk: List[str], batch_size: int):
+    """Yield (lower, upper) primary-key bounds of consecutive batches (keyset pagination)."""
+    from sqlalchemy import text
+
+    keys = ', '.join([f"`{k}`" for k in pk])
+    params = ', '.join([f":k{i}" for i in range(len(pk))])
+    lower = None
+    while True:
+        where = f"WHERE ({keys}) > ({params})" if lower is not None else ''
+        sql = text(f"SELECT {keys} FROM `{database}`.`{src}` {where} ORDER BY {keys} LIMIT 1 OFFSET {batch_size - 1}")
+        bind = {f"k{i}": v for i, v in enumerate(lower)} if lower is not None else {}
+        with importer.engine.connect() as conn:
+            row = conn.execute(sql, bind).fetchone()
+        upper = tuple(row) if row is not None else None
+        yield lower, upper
+        if upper is None:
+            return
+        lower = upper
+
+
+def _date_batches(importer: 'MySQLImporter', src: str, database: str, batch_size: int):
+    """Yield [first, last] valuation_date windows holding roughly batch_size rows each."""
+    from sqlalchemy import text
+
+    sql = text(f"SELECT `valuation_date`, COUNT(*) FROM `{database}`.`{src}` GROUP BY `valuation_date` ORDER BY `valuation_date`")
+    with importer.engine.connect() as conn:
+        counts = conn.execute(sql).fetchall()
+    first, rows = None, 0
+    for d, cnt in counts:
+        if first is None:
+            first = d
+        rows += int(cnt)
+        if rows >= batch_size:
+            yield first, d
+            first, rows = None, 0
+    if first is not None:
+        yield first, counts[-1][0]
+
+
+def _date_range(importer: 'MySQLImporter', src: str, database: str, column: str):
+    from sqlalchemy import text
+
+    sql = text(f"SELECT MIN(`{column}`), MAX(`{column}`) FROM `{database}`.`{src}`")
+    with importer.engine.connect() as conn:
+        return tuple(conn.execute(sql).fetchone())
+
+
+def migrate_table(importer: 'MySQLImporter', src: str, user_name: str, target: str, database: str,
+                  batch_size: int = 20000, pause: float = 0.0):
+    """Copy one per-user table into the consolidated table in committed batches.
+
+    Tables with a primary key are copied with keyset pagination and upserts, so the copy
+    can be rerun (or run while the importers dual-write) without duplicating rows. Keyless
+    contribution tables get CONTRIBUTION_KEY_FIELDS as the target key and are upserted by
+    valuation_date windows, which is just as safe. Other tables without a key in the target
+    are copied after clearing the user's rows there; `table_layout: dual` must be off while
+    those are migrated, or rows imported meanwhile are deleted or duplicated.
+    """
+    from sqlalchemy import text
+    import pandas as pd
+    from importer import CONTRIBUTION_KEY_FIELDS, with_user_name
+
+    schema = get_table_schema(importer, src, database)
+    pk = importer._get_table_pk_columns(src, db=database)
+    cols = [c['field'] for c in schema if c['field'] != 'user_name']
+    target_key = pk or ([] if any(k not in cols for k in CONTRIBUTION_KEY_FIELDS) else CONTRIBUTION_KEY_FIELDS)
+    _, schema_t, pk_t, idx_t = with_user_name(pd.DataFrame(columns=cols), schema, target_key, user_name)
+    importer.create_table(target, schema_t, pk_t, db=database, index_fields=idx_t)
+
+    existing = importer._get_table_columns(target, db=database)
+    with importer.engine.begin() as conn:
+        for c in schema_t:
+            if c['field'] not in existing:
+                conn.execute(text(f"ALTER TABLE `{database}`.`{target}` ADD COLUMN `{c['field']}` {c['type']} NULL"))
+
+    # 复制前按源表的日期范围补齐分区，否则早于第一个分区的历史行都会落进第一个分区
+    date_column = importer.partition_column
+    partitioned = bool(importer.partition_by) and date_column in cols
+    if partitioned:
+        low, high = _date_range(importer, src, database, date_column)
+        if high is not None:
+            importer.maintain_partitions(target, high, from_date=low, db=database, expire=False)
+
+    col_list = ', '.join([f"`{c}`" for c in cols])
+    insert_head = (f"INSERT INTO `{database}`.`{target}` (`user_name`, {col_list}) "
+                   f"SELECT :user_name, {col_list} FROM `{database}`.`{src}`")
+    update_clause = ', '.join([f"`{c}`=VALUES(`{c}`)" for c in cols])
+    copied = 0
+
+    target_pk = importer._get_table_pk_columns(target, db=database)
+    if pk:
+        keys = ', '.join([f"`{k}`" for k in pk])
+        for lower, upper in _key_batches(importer, src, database, pk, batch_size):
+            conds, bind = [], {'user_name': user_name}
+            if lower is not None:
+                conds.append(f"({keys}) > ({', '.join([f':lo{i}' for i in range(len(pk))])})")
+                bind.update({f"lo{i}": v for i, v in enumerate(lower)})
+            if upper is not None:
+                conds.append(f"({keys}) <= ({', '.join([f':hi{i}' for i in range(len(pk))])})")
+                bind.update({f"hi{i}": v for i, v in enumerate(upper)})
+            where = f" WHERE {' AND '.join(conds)}" if conds else ''
+            sql = f"{insert_head}{where} ON DUPLICATE KEY UPDATE {update_clause}"
+            with importer.engine.begin() as conn:
+                copied += conn.execute(text(sql), bind).rowcount
+            if pause:
+                time.sleep(pause)
+        if partitioned:
+            importer.expire_partitions(target, db=database)
+        logging.info('%s -> %s: 已复制 %d 行（影响行数）', src, target, copied)
+        return copied
+
+    if not target_pk:
+        # 目标表无主键时无法 upsert，先清掉该用户已有的行保证可重跑；期间双写导入的行会被删除，迁移时须关闭 dual
+        logging.warning('%s.%s 没有主键，将先删除用户 %s 的已有行再复制；迁移期间不要使用 table_layout: dual',
+                        database, target, user_name)
+        while True:
+            with importer.engine.begin() as conn:
+                deleted = conn.execute(text(f"DELETE FROM `{database}`.`{target}` WHERE `user_name` = :u LIMIT {batch_size}"),
+                                       {'u': user_name}).rowcount
+            if not deleted:
+                break
+
+    suffix = f" ON DUPLICATE KEY UPDATE {update_clause}" if target_pk else ''
+    if 'valuation_date' in cols:
+        for first, last in _date_batches(importer, src, database, batch_size):
+            sql = f"{insert_head} WHERE `valuation_date` BETWEEN :d0 AND :d1{suffix}"
+            with importer.engine.begin() as conn:
+                copied += conn.execute(text(sql), {'user_name': user_name, 'd0': first, 'd1': last}).rowcount
+            if pause:
+                time.sleep(pause)
+    else:
+        with importer.engine.begin() as conn:
+            copied += conn.execute(text(f"{insert_head}{suffix}"), {'user_name': user_name}).rowcount
+    if partitioned:
+        importer.expire_partitions(target, db=database)
+    logging.info('%s -> %s: 已复制 %d 行', src, target, copied)
+    return copied
+
+
+def main(cfg_path: str = DEFAULT_DB_CONFIG, users: Optional[List[str]] = None, batch_size: int = 20000,
+         pause: float = 0.0, dry_run: bool = False):
+    import yaml
+    from importer import MySQLImporter
+
+    with open(cfg_path, 'r', encoding='utf-8') as f:
+        cfg = yaml.safe_load(f) or {}
+    database = cfg.get('database6') or cfg.get('database')
+
+    importer = MySQLImporter(cfg_path)
+    try:
+        tables = discover_user_tables(importer, database, users)
+        logging.info('在 %s 中找到 %d 张按用户划分的结果表', database, len(tables))
+        for src, user_name, target in tables:
+            if dry_run:
+                logging.info('[dry-run] %s.%s -> %s.%s (user_name=%s)', database, src, database, target, user_name)
+                continue
+            try:
+                migrate_table(importer, src, user_name, target, database, batch_size=batch_size, pause=pause)
+            except Exception:
+                logging.exception('迁移 %s.%s 失败', database, src)
+    finally:
+        importer.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Copy per-user result tables into the consolidated (user_name keyed) tables.')
+    parser.add_argument('--users', nargs='*', help='Only migrate these users (default: all).')
+    parser.add_argument('--batch-size', type=int, default=None, help='Rows per committed batch (default: chunk_size from db.yaml).')
+    parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches to limit load.')
+    parser.add_argument('--dry-run', action='store_true', help='Only list the tables that would be migrated.')
+    parser.add_argument('--config', default=DEFAULT_DB_CONFIG, help='Path to db.yaml.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)-8s %(name)s: %(message)s",
+                        datefmt="%Y-%m-%d %H:%M:%S")
+
+    batch_size = args.batch_size
+    if batch_size is None:
+        try:
+            import yaml
+            with open(args.config, 'r', encoding='utf-8') as f:
+                batch_size = int((yaml.safe_load(f) or {}).get('chunk_size', 20000))
+        except Exception:
+            batch_size = 20000
+
+    main(args.config, users=args.users, batch_size=batch_size, pause=args.pause, dry_run=args.dry_run)
@@ -125,14 +125,15 @@ catch
 end
 
 try
-    netScript = fullfile(currentDir, 'import_netvalue_to_mysql.py');
+    % import_client.py 把任务交给常驻的 import_service.py；服务未启动时在本进程内执行
+    clientScript = fullfile(currentDir, 'import_client.py');
 
     table_name = [uname '_backtest'];
 
 
     base_folder = fullfile(currentDir, 'output', 'backtest_results', uname);
 
-    cmd2 = sprintf('"%s" "%s" "%s" "%s" "%s"', pythonExe, netScript, table_name, sid, base_folder);
+    cmd2 = sprintf('"%s" "%s" netvalue "%s" "%s" "%s"', pythonExe, clientScript, table_name, sid, base_folder);
     [status2, cmdout2] = system(cmd2);
     fprintf_log('Netvalue Python return status: %d', status2);
     if ~isempty(cmdout2)
@@ -152,9 +153,9 @@ catch ME2
 end
 
 try
-    perfScript = fullfile(currentDir, 'import_performance_to_mysql.py');
+    clientScript = fullfile(currentDir, 'import_client.py');
     perf_table_name = [uname '_backtest_performance'];
-    cmd3 = sprintf('"%s" "%s" "%s" "%s" "%s"', pythonExe, perfScript, perf_table_name, sid, base_folder);
+    cmd3 = sprintf('"%s" "%s" performance "%s" "%s" "%s"', pythonExe, clientScript, perf_table_name, sid, base_folder);
     [status3, cmdout3] = system(cmd3);
     fprintf_log('Performance Python return status: %d', status3);
     if ~isempty(cmdout3)
@@ -174,12 +175,12 @@ end
 
 
 try
-    contribScript = fullfile(currentDir, 'import_contributions_to_mysql.py');
+    clientScript = fullfile(currentDir, 'import_client.py');
     contrib_table = [uname '_contribution'];
     contrib_weight_table = [uname '_contribution_weight'];
 
     
-    cmd4 = sprintf('"%s" "%s" "%s" "%s" "%s" "%s"', pythonExe, contribScript, contrib_table, contrib_weight_table, sid, base_folder);
+    cmd4 = sprintf('"%s" "%s" contributions "%s" "%s" "%s" "%s"', pythonExe, clientScript, contrib_table, contrib_weight_table, sid, base_folder);
     [status4, cmdout4] = system(cmd4);
     fprintf_log('Contribution Python return status: %d', status4);
     if ~isempty(cmdout4)
@@ -0,0 +1,98 @@
+"""Startup-time benchmark for the import entry points.
+
+MATLAB often calls the importers when there is nothing to import, so those calls should
+only cost an interpreter start. Each scenario is run with `python -X importtime`; the
+benchmark reports wall-clock time and the cumulative import time, and fails (exit code 1)
+when a no-op invocation exits non-zero, loads one of the heavy modules or exceeds --budget-ms.
+
+    python startup_benchmark.py
+    python startup_benchmark.py --repeat 10 --budget-ms 300
+"""
+from typing import Dict, List
+import os
+import re
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# 空操作时不允许加载的模块
+HEAVY_MODULES = ('pandas', 'numpy', 'sqlalchemy', 'pymysql', 'yaml')
+
+_IMPORTTIME = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$')
+
+
+def scenarios(empty_folder: str) -> Dict[str, List[str]]:
+    """No-op invocations as MATLAB would issue them: --help and an empty result folder."""
+    return {
+        'netvalue --help': ['import_netvalue_to_mysql.py', '--help'],
+        'netvalue empty': ['import_netvalue_to_mysql.py', 'u_backtest', '', empty_folder],
+        'performance empty': ['import_performance_to_mysql.py', 'u_backtest_performance', '', empty_folder],
+        'contributions empty': ['import_contributions_to_mysql.py', 'u_contribution', 'u_contribution_weight', '',
+                                empty_folder],
+        # 服务未启动时客户端回退到进程内执行
+        'client empty': ['import_client.py', 'netvalue', 'u_backtest', '', empty_folder, '--port', '1'],
+    }
+
+
+def parse_importtime(stderr: str):
+    """Return (total cumulative import time in ms, set of top-level packages imported)."""
+    total_us = 0
+    modules = set()
+    for line in stderr.splitlines():
+        m = _IMPORTTIME.match(line)
+        if not m:
+            continue
+        modules.add(m.group(4).split('.')[0])
+        # 缩进为 1 个空格的是顶层导入，其累计时间已包含子模块
+        if len(m.group(3)) == 1:
+            total_us += int(m.group(2))
+    return total_us / 1000.0, modules
+
+
+def run_scenario(argv: List[str], repeat: int):
+    """Return (median wall ms, median import ms, heavy modules loaded, first non-zero exit code or 0)."""
+    walls, imports, loaded, returncode = [], [], set(), 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, '-X', 'importtime'] + argv, cwd=HERE,
+                              capture_output=True, text=True, encoding='utf-8', errors='replace')
+        walls.append((time.perf_counter() - start) * 1000)
+        # 提前崩溃（例如 ImportError）的运行看起来很快，必须单独判为失败
+        returncode = returncode or proc.returncode
+        import_ms, modules = parse_importtime(proc.stderr)
+        imports.append(import_ms)
+        loaded |= modules
+    return statistics.median(walls), statistics.median(imports), sorted(loaded & set(HEAVY_MODULES)), returncode
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Measure startup time of no-op importer invocations.')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per scenario; the median is reported.')
+    parser.add_argument('--budget-ms', type=float, default=None,
+                        help='Fail when the median wall-clock time of a scenario exceeds this.')
+    args = parser.parse_args(argv)
+
+    baseline, _, _, _ = run_scenario(['-c', 'pass'], args.repeat)
+    print(f"{'scenario':<22}{'wall ms':>10}{'import ms':>12}  heavy modules")
+    print(f"{'python -c pass':<22}{baseline:>10.1f}{'':>12}")
+
+    failed = False
+    with tempfile.TemporaryDirectory() as empty_folder:
+        for name, cmd in scenarios(empty_folder).items():
+            wall, import_ms, heavy, returncode = run_scenario(cmd, args.repeat)
+            over = args.budget_ms is not None and wall > args.budget_ms
+            failed = failed or bool(heavy) or over or returncode != 0
+            flag = ' (over budget)' if over else ''
+            if returncode != 0:
+                flag += f' (exit code {returncode})'
+            print(f"{name:<22}{wall:>10.1f}{import_ms:>12.1f}  {', '.join(heavy) or '-'}{flag}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,328 @@
+"""Compact columnar store for a backtest input folder (<inputpath>/<yyyy-MM-dd>/*.csv).
+
+Each date folder holds Stock_code.csv, weight.csv and Stock_score.csv (code and score files
+start with a date header line). The packer turns the whole tree into one file:
+
+    magic (8 bytes) | header length (uint64) | JSON header | 64-byte aligned arrays
+
+    dates     datetime64[D]  (n_dates,)      sorted trading dates
+    offsets   int64          (n_dates + 1,)  CSR row offsets per date
+    code_idx  int32          (n_rows,)       index into the interned code dictionary
+    weight    float32        (n_rows,)
+    score     float32        (n_rows,)
+    codes     uint8          (n_bytes,)      '\\n' joined UTF-8 code dictionary
+
+Rows are stored exactly as they appear in the CSVs (no filtering or normalisation), so
+consumers apply the same rules as get_portfolio_weights.m. WeightStore opens the file
+through a memory map and returns per-date / date-range views without copying.
+"""
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+import os
+import re
+import json
+import logging
+import argparse
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'WSTORE01'
+ALIGN = 64
+DEFAULT_STORE_NAME = 'weight_store.bin'
+DATE_DIR_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+CODE_FILE = 'Stock_code.csv'
+WEIGHT_FILE = 'weight.csv'
+SCORE_FILE = 'Stock_score.csv'
+
+
+class DaySlice(NamedTuple):
+    date: np.datetime64
+    code_idx: np.ndarray
+    weight: np.ndarray
+    score: np.ndarray
+
+
+def _read_lines(path: Path, skip_header: bool) -> List[str]:
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        lines = [ln.strip().split(',')[0].strip() for ln in f]
+    if skip_header:
+        lines = lines[1:]
+    # drop trailing blank lines only, keep row alignment between the three files
+    while lines and not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def _to_float(values: List[str]) -> np.ndarray:
+    out = np.empty(len(values), dtype=np.float32)
+    for i, v in enumerate(values):
+        try:
+            out[i] = float(v)
+        except ValueError:
+            out[i] = np.nan
+    return out
+
+
+def discover_date_dirs(input_path: str) -> List[str]:
+    p = Path(input_path)
+    if not p.exists():
+        raise FileNotFoundError(f"input folder not found: {input_path}")
+    return sorted(x.name for x in p.iterdir() if x.is_dir() and DATE_DIR_RE.match(x.name))
+
+
+def read_date_folder(date_dir: Path):
+    """Read one date folder; returns (codes, weights, scores) or None if files are missing/inconsistent."""
+    files = [date_dir / CODE_FILE, date_dir / WEIGHT_FILE, date_dir / SCORE_FILE]
+    if not all(f.exists() for f in files):
+        logger.warning('skip %s: missing portfolio csv files', date_dir)
+        return None
+    codes = _read_lines(files[0], skip_header=True)
+    weights = _read_lines(files[1], skip_header=False)
+    scores = _read_lines(files[2], skip_header=True)
+    if not (len(codes) == len(weights) == len(scores)):
+        logger.warning('skip %s: row count mismatch (code %d, weight %d, score %d)',
+                       date_dir, len(codes), len(weights), len(scores))
+        return None
+    return codes, _to_float(weights), _to_float(scores)
+
+
+def _write_store(path: str, dates: np.ndarray, offsets: np.ndarray, code_idx: np.ndarray,
+                 weight: np.ndarray, score: np.ndarray, codes: List[str]):
+    """Write all sections to a temp file and atomically replace `path`."""
+    arrays = {
+        'dates': np.ascontiguousarray(dates, dtype='datetime64[D]'),
+        'offsets': np.ascontiguousarray(offsets, dtype=np.int64),
+        'code_idx': np.ascontiguousarray(code_idx, dtype=np.int32),
+        'weight': np.ascontiguousarray(weight, dtype=np.float32),
+        'score': np.ascontiguousarray(score, dtype=np.float32),
+        'codes': np.frombuffer('\n'.join(codes).encode('utf-8'), dtype=np.uint8),
+    }
+
+    # header length depends on offsets, so lay out sections relative to a padded header size
+    def layout(header_size):
+        sections, pos = {}, header_size
+        for name, arr in arrays.items():
+            pos = (pos + ALIGN - 1) // ALIGN * ALIGN
+            sections[name] = {'offset': pos, 'dtype': arr.dtype.str, 'shape': list(arr.shape)}
+            pos += arr.nbytes
+        return sections
+
+    header_size = ALIGN * 4
+    while True:
+        sections = layout(header_size)
+        header = json.dumps({'version': 1, 'n_codes': len(codes), 'sections': sections}).encode('utf-8')
+        if len(MAGIC) + 8 + len(header) <= header_size:
+            break
+        header_size *= 2
+
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(header)).tobytes())
+        f.write(header)
+        for name, arr in arrays.items():
+            f.seek(sections[name]['offset'])
+            f.write(arr.tobytes())
+        # 末尾的空段（例如没有任何日期）只有 offset 没有数据，文件须延长到所有段的末尾
+        f.truncate(max(sections[name]['offset'] + arr.nbytes for name, arr in arrays.items()))
+    os.replace(tmp, path)
+
+
+class WeightStore:
+    """Read-only, memory-mapped view of a packed weight/score store."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mm = np.memmap(path, dtype=np.uint8, mode='r')
+        if bytes(self._mm[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"not a weight store file: {path}")
+        hlen = int(np.frombuffer(self._mm[len(MAGIC):len(MAGIC) + 8], dtype=np.uint64)[0])
+        start = len(MAGIC) + 8
+        header = json.loads(bytes(self._mm[start:start + hlen]).decode('utf-8'))
+        self._arrays: Dict[str, np.ndarray] = {}
+        for name, sec in header['sections'].items():
+            dtype = np.dtype(sec['dtype'])
+            count = int(np.prod(sec['shape'])) if sec['shape'] else 0
+            self._arrays[name] = np.frombuffer(self._mm, dtype=dtype, count=count, offset=sec['offset'])
+        blob = bytes(self._arrays['codes'])
+        self.codes = np.array(blob.decode('utf-8').split('\n') if blob else [], dtype=object)
+
+    @property
+    def dates(self) -> np.ndarray:
+        return self._arrays['dates']
+
+    @property
+    def offsets(self) -> np.ndarray:
+        return self._arrays['offsets']
+
+    @property
+    def code_idx(self) -> np.ndarray:
+        return self._arrays['code_idx']
+
+    @property
+    def weight(self) -> np.ndarray:
+        return self._arrays['weight']
+
+    @property
+    def score(self) -> np.ndarray:
+        return self._arrays['score']
+
+    def __len__(self):
+        return len(self.dates)
+
+    def _date_pos(self, date) -> int:
+        d = np.datetime64(date, 'D')
+        i = int(np.searchsorted(self.dates, d))
+        if i >= len(self.dates) or self.dates[i] != d:
+            raise KeyError(f"date not in store: {d}")
+        return i
+
+    def get(self, date) -> DaySlice:
+        """Return the rows for one date as zero-copy views."""
+        i = self._date_pos(date)
+        lo, hi = int(self.offsets[i]), int(self.offsets[i + 1])
+        return DaySlice(self.dates[i], self.code_idx[lo:hi], self.weight[lo:hi], self.score[lo:hi])
+
+    def range(self, start=None, end=None):
+        """Return (dates, offsets, code_idx, weight, score) views for start <= date <= end.
+
+        offsets are relative to the returned row arrays (offsets[0] == 0).
+        """
+        lo_d = 0 if start is None else int(np.searchsorted(self.dates, np.datetime64(start, 'D'), side='left'))
+        hi_d = len(self.dates) if end is None else int(np.searchsorted(self.dates, np.datetime64(end, 'D'), side='right'))
+        lo, hi = int(self.offsets[lo_d]), int(self.offsets[hi_d])
+        return (self.dates[lo_d:hi_d], self.offsets[lo_d:hi_d + 1] - lo,
+                self.code_idx[lo:hi], self.weight[lo:hi], self.score[lo:hi])
+
+    def codes_of(self, day: DaySlice) -> np.ndarray:
+        return self.codes[day.code_idx]
+
+    def weight_matrix(self, start=None, end=None, codes: Optional[np.ndarray] = None):
+        """Dense dates x codes weight and score matrices for start <= date <= end.
+
+        Weights are filtered (NaN / <= 0 dropped) and normalized per date exactly like
+        get_portfolio_weights.m. The codes axis is the sorted set of held codes, or
+        `codes` (sorted) when given. Returns (dates, codes, W, S); W is 0 and S is NaN
+        where a code is not held.
+        """
+        dates, offsets, code_idx, weight, score = self.range(start, end)
+        row_date = np.repeat(np.arange(len(dates)), np.diff(offsets))
+        keep = ~np.isnan(weight) & (weight > 0)
+        row_date, code_idx = row_date[keep], code_idx[keep]
+        w = weight[keep].astype(np.float64)
+        s = score[keep].astype(np.float64)
+        totals = np.bincount(row_date, weights=w, minlength=len(dates))
+        w = w / totals[row_date]
+
+        row_codes = self.codes[code_idx].astype(str)
+        if codes is None:
+            codes = np.unique(row_codes)
+        col = np.searchsorted(codes, row_codes)
+        col_ok = col < len(codes)
+        col_ok[col_ok] = codes[col[col_ok]] == row_codes[col_ok]
+
+        W = np.zeros((len(dates), len(codes)))
+        S = np.full((len(dates), len(codes)), np.nan)
+        W[row_date[col_ok], col[col_ok]] = w[col_ok]
+        S[row_date[col_ok], col[col_ok]] = s[col_ok]
+        return dates, codes, W, S
+
+
+def pack(input_path: str, out_path: Optional[str] = None) -> str:
+    """Pack every date folder under input_path into a single store file."""
+    out_path = out_path or os.path.join(input_path, DEFAULT_STORE_NAME)
+    empty = (np.array([], dtype='datetime64[D]'), np.zeros(1, dtype=np.int64),
+             np.array([], dtype=np.int32), np.array([], dtype=np.float32), np.array([], dtype=np.float32), [])
+    return _extend(input_path, out_path, *empty)
+
+
+def append(input_path: str, out_path: Optional[str] = None) -> str:
+    """Add date folders newer than the last packed date; existing rows are reused, not re-parsed."""
+    out_path = out_path or os.path.join(input_path, DEFAULT_STORE_NAME)
+    if not os.path.exists(out_path):
+        return pack(input_path, out_path)
+    store = WeightStore(out_path)
+    base = (np.array(store.dates), np.array(store.offsets), np.array(store.code_idx),
+            np.array(store.weight), np.array(store.score), list(store.codes))
+    del store
+    return _extend(input_path, out_path, *base)
+
+
+def _extend(input_path, out_path, dates, offsets, code_idx, weight, score, codes):
+    last = dates[-1] if len(dates) else None
+    code_map = {c: i for i, c in enumerate(codes)}
+    new_dates, new_counts, new_idx, new_w, new_s = [], [], [], [], []
+    for name in discover_date_dirs(input_path):
+        d = np.datetime64(name, 'D')
+        if last is not None and d <= last:
+            continue
+        res = read_date_folder(Path(input_path) / name)
+        if res is None:
+            continue
+        day_codes, w, s = res
+        idx = np.empty(len(day_codes), dtype=np.int32)
+        for i, c in enumerate(day_codes):
+            j = code_map.get(c)
+            if j is None:
+                j = code_map[c] = len(codes)
+                codes.append(c)
+            idx[i] = j
+        new_dates.append(d)
+        new_counts.append(len(day_codes))
+        new_idx.append(idx)
+        new_w.append(w)
+        new_s.append(s)
+
+    if not new_dates and os.path.exists(out_path):
+        logger.info('no new date folders in %s', input_path)
+        return out_path
+
+    dates = np.concatenate([dates, np.array(new_dates, dtype='datetime64[D]')])
+    offsets = np.concatenate([offsets, offsets[-1] + np.cumsum(new_counts, dtype=np.int64)])
+    code_idx = np.concatenate([code_idx] + new_idx)
+    weight = np.concatenate([weight] + new_w)
+    score = np.concatenate([score] + new_s)
+    _write_store(out_path, dates, offsets, code_idx, weight, score, codes)
+    logger.info('packed %d new dates (%d total, %d rows, %d codes) into %s',
+                len(new_dates), len(dates), len(code_idx), len(codes), out_path)
+    return out_path
+
+
+def open_store(input_path: str, store_path: Optional[str] = None) -> WeightStore:
+    """Open the store for a packed file or an input folder without writing into the folder.
+
+    A store file is opened as is. For an input folder, `store_path` (when given) is packed or
+    appended first; otherwise the folder's existing weight_store.bin is only read.
+    """
+    if not os.path.isdir(input_path):
+        return WeightStore(input_path)
+    if store_path:
+        return WeightStore(append(input_path, store_path))
+    path = os.path.join(input_path, DEFAULT_STORE_NAME)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found: run `python weight_store.py pack {input_path}` "
+                                f"or pass --store <file> to build one elsewhere")
+    store = WeightStore(path)
+    date_dirs = discover_date_dirs(input_path)
+    if date_dirs and (not len(store) or np.datetime64(date_dirs[-1], 'D') > store.dates[-1]):
+        logger.warning('%s 不包含最新的日期目录 %s，可运行 weight_store.py append 更新', path, date_dirs[-1])
+    return store
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)-8s %(name)s: %(message)s",
+                        datefmt="%Y-%m-%d %H:%M:%S")
+    parser = argparse.ArgumentParser(description='Pack a per-date weight/score folder tree into one memory-mappable file.')
+    parser.add_argument('action', choices=['pack', 'append'], help='pack: rebuild from scratch; append: add new dates only')
+    parser.add_argument('input_path', help='Portfolio input folder containing <yyyy-MM-dd> subfolders')
+    parser.add_argument('out_path', nargs='?', help=f'Store file (default: <input_path>/{DEFAULT_STORE_NAME})')
+    args = parser.parse_args()
+
+    if args.action == 'pack':
+        pack(args.input_path, args.out_path)
+    else:
+        append(args.input_path, args.out_path)